@@ -22,6 +22,7 @@ import re
 import subprocess
 import sys
 import tempfile
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 
@@ -199,7 +200,7 @@ class GuidedJobstatsSetup:
 
     def _init_document(self):
         """Initialize the document with header and metadata."""
-        timestamp = subprocess.run(['date'], capture_output=True, text=True).stdout.strip()
+        timestamp = time.strftime('%a %b %e %H:%M:%S %Z %Y')
         
         self._add_to_document("# BCM Jobstats Guided Setup Document")
         self._add_to_document("")
@@ -223,27 +224,35 @@ class GuidedJobstatsSetup:
 
     def _print_header(self, title: str, description: str = ""):
         """Print a formatted section header."""
-        print(f"\n{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.END}")
-        print(f"{Colors.BOLD}{Colors.WHITE}{title}{Colors.END}")
-        print(f"{Colors.CYAN}{'='*80}{Colors.END}")
+        lines = [
+            f"\n{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.END}",
+            f"{Colors.BOLD}{Colors.WHITE}{title}{Colors.END}",
+            f"{Colors.CYAN}{'='*80}{Colors.END}",
+        ]
         if description:
-            print(f"\n{Colors.BLUE}{description}{Colors.END}\n")
+            lines.append(f"\n{Colors.BLUE}{description}{Colors.END}\n")
+        print('\n'.join(lines))
 
     def _print_command_summary(self, commands: List[Dict]):
         """Print a summary of commands that will be executed."""
-        print(f"\n{Colors.BOLD}{Colors.YELLOW}Commands to be executed:{Colors.END}")
-        print(f"{Colors.YELLOW}{'-'*50}{Colors.END}")
+        lines = [
+            f"\n{Colors.BOLD}{Colors.YELLOW}Commands to be executed:{Colors.END}",
+            f"{Colors.YELLOW}{'-'*50}{Colors.END}",
+        ]
         
         for i, cmd in enumerate(commands, 1):
             host = cmd.get('host', 'localhost')
             command = cmd['command']
             description = cmd.get('description', '')
             
-            print(f"\n{Colors.BOLD}{i}. {Colors.GREEN}{host}{Colors.END}")
+            lines.append(f"\n{Colors.BOLD}{i}. {Colors.GREEN}{host}{Colors.END}")
             if description:
-                print(f"   {Colors.BLUE}{description}{Colors.END}")
+                lines.append(f"   {Colors.BLUE}{description}{Colors.END}")
             else:
-                print(f"   {Colors.WHITE}{command}{Colors.END}")
+                lines.append(f"   {Colors.WHITE}{command}{Colors.END}")
+        
+        # Emit the whole summary with one write
+        print('\n'.join(lines))
 
     def _confirm_execution(self, commands: List[Dict]) -> bool:
         """Ask user to confirm command execution."""
@@ -491,18 +500,20 @@ class GuidedJobstatsSetup:
         slurm_conf_commands = [
             {
                 'host': slurm_controller,
-                'command': f'cp {slurm_conf_path} {slurm_conf_path}.backup',
+                'command': f'cp -p --reflink=auto {slurm_conf_path} {slurm_conf_path}.backup',
                 'description': 'Backup slurm.conf before modification'
             },
             {
                 'host': slurm_controller,
                 'command': f'''cat > /tmp/update_slurm_conf.py << 'EOF'
+import os
 import re
 import sys
 
 # Read the file
 with open('{slurm_conf_path}', 'r') as f:
     content = f.read()
+original_content = content
 
 # Settings to update
 settings = {{
@@ -519,27 +530,40 @@ if not autogen_match:
 
 autogen_pos = autogen_match.start()
 
-# Process each setting
+# Replace existing setting lines in a single pass, leaving the
+# AUTOGENERATED SECTION (managed by cmd) untouched
+setting_re = re.compile(r'^(' + '|'.join(re.escape(key) for key in settings) + r')\\s*=.*$', re.MULTILINE)
+found = set()
+
+def replace_setting(match):
+    key = match.group(1)
+    found.add(key)
+    return f'{{key}}={{settings[key]}}'
+
+head = setting_re.sub(replace_setting, content[:autogen_pos])
+
+# Insert any missing settings before AUTOGENERATED SECTION
+new_lines = ''
 for key, value in settings.items():
-    # Look for existing setting
-    pattern = rf'^{{re.escape(key)}}\\s*=.*$'
-    match = re.search(pattern, content, re.MULTILINE)
-    
-    if match:
-        # Replace existing setting
-        old_line = match.group(0)
-        new_line = f'{{key}}={{value}}'
-        content = content.replace(old_line, new_line)
+    if key in found:
         print(f'Updated {{key}}={{value}}')
     else:
-        # Insert new setting before AUTOGENERATED SECTION
-        new_line = f'{{key}}={{value}}'
-        content = content[:autogen_pos] + new_line + '\\n' + content[autogen_pos:]
+        new_lines += f'{{key}}={{value}}\\n'
         print(f'Added {{key}}={{value}}')
+content = head + new_lines + content[autogen_pos:]
+
+# Leave slurm.conf untouched if every setting already had the right value
+if content == original_content:
+    print('slurm.conf already configured, no changes needed')
+    sys.exit(0)
 
-# Write the updated file
-with open('{slurm_conf_path}', 'w') as f:
+# Write the updated file to a temp file, then atomically replace the original
+st = os.stat('{slurm_conf_path}')
+with open('{slurm_conf_path}.tmp', 'w') as f:
     f.write(content)
+os.chmod('{slurm_conf_path}.tmp', st.st_mode & 0o7777)
+os.chown('{slurm_conf_path}.tmp', st.st_uid, st.st_gid)
+os.replace('{slurm_conf_path}.tmp', '{slurm_conf_path}')
 
 print('slurm.conf updated successfully')
 EOF
@@ -13,9 +13,16 @@ import time
 import subprocess
 import json
 import os
+import re
+import shutil
 import socket
+import signal
+import tempfile
+import threading
 import logging
-from datetime import datetime, timedelta
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from typing import List, Optional, Dict, Tuple
 
 # Try to import pythoncm, but make it optional
@@ -26,23 +33,70 @@ except ImportError:
     HAS_PYTHONCM = False
     pythoncm = None
 
+# Use orjson for faster JSON (de)serialization when available
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+    orjson = None
+
+# Matches the slurmclient role anywhere in cmsh output, without lowercasing it first
+SLURMCLIENT_ROLE_RE = re.compile(r'slurmclient', re.IGNORECASE)
+# Dashed rule under the header of a cmsh "list" table; only a successful list prints it
+CMSH_TABLE_RULE_RE = re.compile(r'^-{3,}[-\s]*$', re.MULTILINE)
+# cmsh errors, e.g. an unknown device on "use", a command unknown in the current mode,
+# or an unreachable CMDaemon
+CMSH_ERROR_RE = re.compile(r'error|not found|unknown|unable|cannot|failed|invalid|no such', re.IGNORECASE)
+
+def _json_default(obj):
+    """Encode values the stdlib json module cannot, writing datetimes in ISO 8601 like orjson"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+def _json_dumps(obj) -> bytes:
+    """Serialize obj to indented, key-sorted JSON bytes
+
+    Sorted keys keep the output canonical for no-op write checks; the indent is kept
+    because the config file is edited by hand.
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, indent=2, sort_keys=True, default=_json_default).encode()
+
+def _json_loads(data: bytes):
+    """Deserialize JSON bytes"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
 class BCMRoleMonitor:
     def __init__(self, config_file: str = '/etc/bcm-role-monitor/config.json'):
         self.config_file = config_file
+        # Canonical snapshot of what is on disk, so save_config can skip no-op writes;
+        # None when the file is missing or unreadable, so the first save always writes
+        self._config_on_disk = None
         self.config = self.load_config()
         self.hostname = socket.gethostname()
         self.state_file = f'/var/lib/bcm-role-monitor/{self.hostname}_state.json'
         self.log_file = f'/var/log/bcm-role-monitor.log'
+        self._state_dir_ready = False
         
         # Services to manage
         self.services = ['cgroup_exporter', 'node_exporter', 'nvidia_gpu_exporter']
         
-        # Retry tracking
-        self.retry_state = {}
+        # Retry tracking; entries are created on first access and reset by removal
+        self.retry_state = defaultdict(self._fresh_retry_entry)
         
         # Setup logging
         self.setup_logging()
         
+        # Stop promptly on systemd shutdown instead of finishing the current sleep
+        self._stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        signal.signal(signal.SIGHUP, self._handle_stop_signal)
+        
         # BCM connection (only if pythoncm is available)
         if HAS_PYTHONCM:
             self.cm = pythoncm.ClusterManager()
@@ -51,6 +105,18 @@ class BCMRoleMonitor:
             self.cm = None
             self.cluster = None
         
+        # Cached hostname -> node lookup, refreshed periodically and on reconnect
+        self._node_by_host = None
+        self._node_by_host_time = 0.0
+        
+        # Control socket directory for SSH connection multiplexing (SSH fallback path),
+        # created on first use, and the headnode the last successful cmsh check ran on
+        self._ssh_ctl_dir = None
+        self._cmsh_headnode = None
+        
+        # Worker used to overlap service status queries with the role check
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        
     def setup_logging(self):
         """Setup logging configuration"""
         os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
@@ -64,6 +130,11 @@ class BCMRoleMonitor:
         )
         self.logger = logging.getLogger(__name__)
         
+    def _handle_stop_signal(self, signum, frame):
+        """Request a clean shutdown of the monitor loop"""
+        self.logger.info("Received signal %s, shutting down", signal.Signals(signum).name)
+        self._stop_event.set()
+    
     def load_config(self) -> Dict:
         """Load configuration from file or create default"""
         default_config = {
@@ -76,25 +147,28 @@ class BCMRoleMonitor:
             "max_retries": 3
         }
         
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    # Merge with defaults
-                    for key, value in default_config.items():
-                        if key not in config:
-                            config[key] = value
-                    return config
-            except Exception as e:
-                self.logger.error(f"Error loading config: {e}")
-                return default_config
-        else:
+        try:
+            with open(self.config_file, 'rb') as f:
+                config = _json_loads(f.read())
+        except FileNotFoundError:
             # Create default config file
             os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-            with open(self.config_file, 'w') as f:
-                json.dump(default_config, f, indent=2)
+            self._config_on_disk = _json_dumps(default_config)
+            with open(self.config_file, 'wb') as f:
+                f.write(self._config_on_disk)
             self.logger.info(f"Created default config at {self.config_file}")
             return default_config
+        except Exception as e:
+            self.logger.error(f"Error loading config: {e}")
+            return default_config
+        # Snapshot before merging, so defaults missing from the file still get saved
+        self._config_on_disk = _json_dumps(config)
+        
+        # Merge with defaults
+        for key, value in default_config.items():
+            if key not in config:
+                config[key] = value
+        return config
     
     def discover_bcm_headnodes(self) -> List[str]:
         """Discover BCM headnodes from configuration (set during deployment)"""
@@ -154,6 +228,7 @@ class BCMRoleMonitor:
                     
                     if self.cluster.connect():
                         self.logger.info(f"Successfully connected to BCM at {headnode}")
+                        self._node_by_host = None
                         return True
                     else:
                         self.logger.warning(f"Failed to connect to BCM at {headnode}")
@@ -167,7 +242,7 @@ class BCMRoleMonitor:
             for headnode in headnodes:
                 try:
                     result = subprocess.run(
-                        ['ssh', '-o', 'ConnectTimeout=5', '-o', 'BatchMode=yes', 
+                        ['ssh', *self._ssh_opts(), '-o', 'ConnectTimeout=5', '-o', 'BatchMode=yes', 
                          headnode, 'echo "SSH test successful"'],
                         capture_output=True,
                         text=True,
@@ -184,9 +259,17 @@ class BCMRoleMonitor:
         return False
     
     def save_config(self):
-        """Save current configuration"""
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=2)
+        """Save current configuration if it differs from what is on disk"""
+        canonical = _json_dumps(self.config)
+        if canonical == self._config_on_disk:
+            return
+        
+        # Write to temp file, then atomic replace
+        temp_file = f"{self.config_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(canonical)
+        os.replace(temp_file, self.config_file)
+        self._config_on_disk = canonical
     
     def check_slurmclient_role(self) -> Optional[bool]:
         """Check if slurmclient role is assigned to this node via configuration overlay"""
@@ -204,32 +287,32 @@ class BCMRoleMonitor:
     
     def _check_role_via_api(self) -> Optional[bool]:
         """Check role using BCM Python API"""
-        # Get the current node
-        nodes = self.cluster.getAll('node')
-        current_node = None
+        # Get the current node, refreshing the lookup table when it is stale
+        now = time.monotonic()
+        if (self._node_by_host is None or
+                now - self._node_by_host_time > self.config['check_interval'] * 10):
+            self._node_by_host = {node.hostname: node for node in self.cluster.getAll('node')}
+            self._node_by_host_time = now
         
-        for node in nodes:
-            if node.hostname == self.hostname:
-                current_node = node
-                break
+        current_node = self._node_by_host.get(self.hostname)
         
         if not current_node:
-            self.logger.error(f"Node {self.hostname} not found in BCM")
+            self.logger.error("Node %s not found in BCM", self.hostname)
             return None
         
         # Check roles assigned to the node
-        roles = current_node.roles
-        
-        # Look for slurmclient role (could be via overlay)
-        has_slurmclient = False
-        for role in roles:
-            role_name = role.name if hasattr(role, 'name') else str(role)
-            self.logger.debug(f"Found role: {role_name}")
-            if 'slurmclient' in role_name.lower():
-                has_slurmclient = True
-                break
+        role_names = {
+            (role.name if hasattr(role, 'name') else str(role)).lower()
+            for role in current_node.roles
+        }
+        self.logger.debug("Found roles: %s", role_names)
+        
+        # Look for slurmclient role; fall back to a substring match for roles whose
+        # names carry an overlay prefix or suffix
+        has_slurmclient = ('slurmclient' in role_names or
+                           any('slurmclient' in name for name in role_names))
         
-        self.logger.info(f"Node {self.hostname} slurmclient role: {has_slurmclient}")
+        self.logger.info("Node %s slurmclient role: %s", self.hostname, has_slurmclient)
         return has_slurmclient
     
     def _check_role_via_ssh(self) -> Optional[bool]:
@@ -239,31 +322,72 @@ class BCMRoleMonitor:
         for headnode in headnodes:
             try:
                 # Use cmsh to check roles for this node
-                result = subprocess.run([
-                    'ssh', '-o', 'ConnectTimeout=10', '-o', 'BatchMode=yes',
-                    headnode, 
-                    f'cmsh -c "device; use {self.hostname}; roles; list"'
-                ], capture_output=True, text=True, timeout=15)
+                result = self._cmsh_query(
+                    headnode, f"device; use {self.hostname}; roles; list"
+                )
                 
-                if result.returncode == 0:
-                    # Parse the output to look for slurmclient role
-                    output = result.stdout.lower()
-                    has_slurmclient = 'slurmclient' in output
-                    
-                    self.logger.info(f"Node {self.hostname} slurmclient role: {has_slurmclient}")
-                    self.logger.debug(f"BCM roles output: {result.stdout}")
-                    return has_slurmclient
-                else:
-                    self.logger.warning(f"cmsh command failed on {headnode}: {result.stderr}")
+                # cmsh -c can exit 0 after a failed command, so also require a roles table
+                # with no error lines ahead of it; anything else must not change services.
+                # Rows are not scanned, as role names may contain the error words
+                output = result.stdout
+                table_rule = CMSH_TABLE_RULE_RE.search(output)
+                if (result.returncode != 0 or table_rule is None or
+                        CMSH_ERROR_RE.search(output, 0, table_rule.start())):
+                    self.logger.warning("cmsh command failed on %s: %s",
+                                        headnode, (result.stderr or output).strip())
+                    self._cmsh_headnode = None
                     continue
+                
+                # Parse the table rows to look for slurmclient role
+                has_slurmclient = SLURMCLIENT_ROLE_RE.search(output, table_rule.end()) is not None
+                
+                self.logger.info("Node %s slurmclient role: %s", self.hostname, has_slurmclient)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("BCM roles output: %s", output)
+                self._cmsh_headnode = headnode
+                return has_slurmclient
                     
             except Exception as e:
-                self.logger.warning(f"SSH + cmsh failed on {headnode}: {e}")
+                self.logger.warning("SSH + cmsh failed on %s: %s", headnode, e)
+                self._cmsh_headnode = None
                 continue
         
-        self.logger.error(f"Could not check roles via SSH on any BCM headnode")
+        self.logger.error("Could not check roles via SSH on any BCM headnode")
         return None
     
+    def _ssh_opts(self) -> List[str]:
+        """SSH options that multiplex every ssh to a headnode over one connection"""
+        if self._ssh_ctl_dir is None:
+            self._ssh_ctl_dir = tempfile.mkdtemp(prefix='bcm-role-monitor-ssh-')
+        # Keep the master up across a few check intervals so each check reuses it
+        persist = max(60, int(self.config['check_interval']) * 3)
+        return [
+            '-o', f'ControlPath={self._ssh_ctl_dir}/%C',
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPersist={persist}s'
+        ]
+    
+    def _cmsh_query(self, headnode: str, command: str,
+                    timeout: float = 15) -> subprocess.CompletedProcess:
+        """Run a cmsh command on headnode over the multiplexed SSH connection"""
+        return subprocess.run(
+            ['ssh', *self._ssh_opts(), '-o', 'ConnectTimeout=10', '-o', 'BatchMode=yes',
+             headnode, f'cmsh -c "{command}"'],
+            capture_output=True, text=True, timeout=timeout
+        )
+    
+    def _close_ssh_masters(self):
+        """Shut down multiplexed SSH master connections and remove the control socket directory"""
+        ctl_dir, self._ssh_ctl_dir, self._cmsh_headnode = self._ssh_ctl_dir, None, None
+        if ctl_dir is None:
+            return
+        for headnode in self.config.get('bcm_headnodes', []):
+            subprocess.run(
+                ['ssh', '-o', f'ControlPath={ctl_dir}/%C', '-O', 'exit', headnode],
+                capture_output=True
+            )
+        shutil.rmtree(ctl_dir, ignore_errors=True)
+    
     def get_service_status(self, service: str) -> bool:
         """Check if a service is running"""
         try:
@@ -273,12 +397,30 @@ class BCMRoleMonitor:
                 text=True
             )
             is_active = result.returncode == 0 and result.stdout.strip() == 'active'
-            self.logger.debug(f"Service {service} status: {'active' if is_active else 'inactive'}")
+            self.logger.debug("Service %s status: %s", service, 'active' if is_active else 'inactive')
             return is_active
         except Exception as e:
-            self.logger.error(f"Error checking service {service}: {e}")
+            self.logger.error("Error checking service %s: %s", service, e)
             return False
     
+    def get_service_statuses(self) -> Dict[str, bool]:
+        """Check all managed services with a single systemctl call"""
+        try:
+            result = subprocess.run(
+                ['systemctl', 'is-active'] + self.services,
+                capture_output=True,
+                text=True
+            )
+            states = result.stdout.split()
+            if len(states) != len(self.services):
+                raise RuntimeError(f"unexpected systemctl output: {result.stdout!r}")
+            statuses = {service: state == 'active' for service, state in zip(self.services, states)}
+            self.logger.debug("Service statuses: %s", statuses)
+            return statuses
+        except Exception as e:
+            self.logger.error("Error checking services: %s", e)
+            return {service: self.get_service_status(service) for service in self.services}
+    
     def start_service(self, service: str) -> bool:
         """Start a service"""
         try:
@@ -291,7 +433,7 @@ class BCMRoleMonitor:
             
             if result.returncode == 0:
                 # Verify it actually started
-                time.sleep(2)
+                self._stop_event.wait(2)
                 if self.get_service_status(service):
                     self.logger.info(f"Successfully started service {service}")
                     return True
@@ -329,43 +471,47 @@ class BCMRoleMonitor:
     
     def load_state(self) -> Dict:
         """Load previous state"""
-        if os.path.exists(self.state_file):
-            try:
-                with open(self.state_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                self.logger.error(f"Error loading state: {e}")
+        try:
+            with open(self.state_file, 'rb') as f:
+                return _json_loads(f.read())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error loading state: {e}")
         return {}
     
     def save_state(self, state: Dict):
         """Save current state"""
         try:
-            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
-            with open(self.state_file, 'w') as f:
-                json.dump(state, f, indent=2)
+            if not self._state_dir_ready:
+                os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+                self._state_dir_ready = True
+            with open(self.state_file, 'wb') as f:
+                f.write(_json_dumps(state))
         except Exception as e:
             self.logger.error(f"Error saving state: {e}")
     
+    @staticmethod
+    def _fresh_retry_entry() -> Dict:
+        """Return a new, reset retry state entry for a service"""
+        return {
+            'attempts': 0,
+            'last_attempt': None,
+            'next_attempt': None,
+            'failed_permanently': False
+        }
+    
     def handle_service_retry(self, service: str) -> bool:
         """Handle service start retry logic"""
         now = datetime.now()
         
-        # Initialize retry state for service if not exists
-        if service not in self.retry_state:
-            self.retry_state[service] = {
-                'attempts': 0,
-                'last_attempt': None,
-                'next_attempt': None,
-                'failed_permanently': False
-            }
-        
         retry_info = self.retry_state[service]
         
         # If permanently failed, don't retry until service is seen running again
         if retry_info['failed_permanently']:
             if self.get_service_status(service):
                 self.logger.info(f"Service {service} is running again, resetting retry state")
-                self.retry_state[service] = {'attempts': 0, 'last_attempt': None, 'next_attempt': None, 'failed_permanently': False}
+                del self.retry_state[service]
             return False
         
         # Check if we should attempt to start
@@ -375,7 +521,7 @@ class BCMRoleMonitor:
         # Attempt to start service
         if self.start_service(service):
             # Success - reset retry state
-            self.retry_state[service] = {'attempts': 0, 'last_attempt': None, 'next_attempt': None, 'failed_permanently': False}
+            del self.retry_state[service]
             return True
         else:
             # Failed - update retry state
@@ -391,10 +537,13 @@ class BCMRoleMonitor:
             
             return False
     
-    def manage_services(self, should_run: bool):
+    def manage_services(self, should_run: bool, statuses: Optional[Dict[str, bool]] = None):
         """Manage services based on role assignment"""
+        if statuses is None:
+            statuses = self.get_service_statuses()
+        
         for service in self.services:
-            is_running = self.get_service_status(service)
+            is_running = statuses[service]
             
             if should_run:
                 if not is_running:
@@ -402,15 +551,13 @@ class BCMRoleMonitor:
                     self.handle_service_retry(service)
                 else:
                     # Service is running and should be - reset any retry state
-                    if service in self.retry_state:
-                        self.retry_state[service] = {'attempts': 0, 'last_attempt': None, 'next_attempt': None, 'failed_permanently': False}
+                    self.retry_state.pop(service, None)
             else:
                 if is_running:
                     self.logger.info(f"Service {service} should not be running, stopping")
                     self.stop_service(service)
                 # Reset retry state when services should not be running
-                if service in self.retry_state:
-                    self.retry_state[service] = {'attempts': 0, 'last_attempt': None, 'next_attempt': None, 'failed_permanently': False}
+                self.retry_state.pop(service, None)
     
     def monitor_loop(self):
         """Main monitoring loop"""
@@ -419,28 +566,31 @@ class BCMRoleMonitor:
         previous_state = self.load_state()
         previous_role_status = previous_state.get('has_slurmclient_role')
         
-        while True:
+        while not self._stop_event.is_set():
             try:
                 # Connect to BCM if not connected
                 if HAS_PYTHONCM:
                     if not self.cluster or not self.cluster.isConnected():
                         if not self.connect_to_bcm():
                             self.logger.error("Cannot connect to BCM, sleeping and retrying")
-                            time.sleep(self.config['check_interval'])
+                            self._stop_event.wait(self.config['check_interval'])
                             continue
-                else:
-                    # For SSH approach, test connectivity each time
+                elif self._cmsh_headnode is None:
+                    # For SSH approach, test connectivity unless the last cmsh check succeeded
                     if not self.connect_to_bcm():
                         self.logger.error("Cannot connect to BCM headnodes via SSH, sleeping and retrying")
-                        time.sleep(self.config['check_interval'])
+                        self._stop_event.wait(self.config['check_interval'])
                         continue
                 
-                # Check role assignment
+                # Check role assignment while service states are queried in the background,
+                # so a slow BCM/cmsh round trip does not delay service health detection
+                statuses_future = self._executor.submit(self.get_service_statuses)
                 has_slurmclient_role = self.check_slurmclient_role()
+                statuses = statuses_future.result()
                 
                 if has_slurmclient_role is None:
                     self.logger.error("Could not determine role status, not making any changes")
-                    time.sleep(self.config['check_interval'])
+                    self._stop_event.wait(self.config['check_interval'])
                     continue
                 
                 # Log role change
@@ -448,7 +598,7 @@ class BCMRoleMonitor:
                     self.logger.info(f"Role change detected: slurmclient role = {has_slurmclient_role}")
                 
                 # Manage services based on role
-                self.manage_services(has_slurmclient_role)
+                self.manage_services(has_slurmclient_role, statuses)
                 
                 # Save current state
                 current_state = {
@@ -460,14 +610,17 @@ class BCMRoleMonitor:
                 previous_role_status = has_slurmclient_role
                 
                 # Sleep until next check
-                time.sleep(self.config['check_interval'])
+                self._stop_event.wait(self.config['check_interval'])
                 
             except KeyboardInterrupt:
                 self.logger.info("Received interrupt signal, shutting down")
                 break
             except Exception as e:
                 self.logger.error(f"Unexpected error in monitor loop: {e}")
-                time.sleep(self.config['check_interval'])
+                self._stop_event.wait(self.config['check_interval'])
+        
+        self._close_ssh_masters()
+        self._executor.shutdown(wait=False)
 
 def main():
     """Main entry point"""
@@ -9,14 +9,21 @@ the service accordingly.
 Author: Jobstats Deployment System
 """
 
-import os
+import functools
+import io
+import re
 import sys
 import json
 import subprocess
+import shutil
 import socket
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 class Colors:
     RED = '\033[0;31m'
@@ -26,28 +33,92 @@ class Colors:
     BOLD = '\033[1m'
     END = '\033[0m'
 
+# Row of 'cmsh device list' output: skips header/separator lines and captures the
+# second column, which is the actual hostname rather than the BCM internal name
+HEADNODE_LINE_RE = re.compile(r'^\s*(?!Name|---)\S+\s+(\S+)')
+
+@functools.lru_cache(maxsize=1)
+def _cmsh_headnodes() -> Tuple[str, ...]:
+    """Query cmsh for BCM headnode hostnames
+    
+    The result is cached for the lifetime of the process; failures are not cached.
+    
+    Raises:
+        subprocess.CalledProcessError: cmsh exited with an error
+        subprocess.TimeoutExpired: cmsh did not finish within 10 seconds
+    """
+    headnodes = []
+    seen = set()
+    cmd = ['cmsh', '-c', 'device list --type headnode']
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:
+        # Drain stderr alongside stdout so a chatty cmsh cannot stall on a full pipe
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()))
+        stderr_reader.daemon = True
+        stderr_reader.start()
+        # Reading stdout line by line has no timeout of its own, so kill a hung cmsh
+        timed_out = threading.Event()
+        def kill_cmsh():
+            if proc.poll() is None:
+                timed_out.set()
+                proc.kill()
+        watchdog = threading.Timer(10, kill_cmsh)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            # Parse the output to extract hostnames as it streams in
+            for line in proc.stdout:
+                match = HEADNODE_LINE_RE.match(line)
+                if match:
+                    hostname = match.group(1)
+                    if hostname not in seen:
+                        seen.add(hostname)
+                        headnodes.append(hostname)
+            returncode = proc.wait()
+            stderr_reader.join()
+        finally:
+            watchdog.cancel()
+    
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, 10)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=''.join(stderr_chunks))
+    
+    return tuple(headnodes)
+
 class BCMRoleMonitorDeployer:
     def __init__(self, config: Dict = None):
         self.script_dir = Path(__file__).parent.absolute()
         self.config = config or {}
         self.dgx_nodes = self.config.get('dgx_nodes', [])
+        # Number of DGX nodes deployed to concurrently
+        self.max_workers = self.config.get('deploy_max_workers', 32)
+        # Serializes output from concurrent per-node deployments
+        self._print_lock = threading.Lock()
+        # Control socket directory for SSH connection multiplexing, created on first use
+        self.ssh_ctl_dir = None
+        self._ssh_ctl_lock = threading.Lock()
         
     def log(self, message):
         """Log info message"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"{Colors.BLUE}[{timestamp}]{Colors.END} {message}")
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self._print_lock:
+            print(f"{Colors.BLUE}[{timestamp}]{Colors.END} {message}")
     
     def error(self, message):
         """Log error message"""
-        print(f"{Colors.RED}[ERROR]{Colors.END} {message}", file=sys.stderr)
+        with self._print_lock:
+            print(f"{Colors.RED}[ERROR]{Colors.END} {message}", file=sys.stderr)
     
     def success(self, message):
         """Log success message"""
-        print(f"{Colors.GREEN}[SUCCESS]{Colors.END} {message}")
+        with self._print_lock:
+            print(f"{Colors.GREEN}[SUCCESS]{Colors.END} {message}")
     
     def warning(self, message):
         """Log warning message"""
-        print(f"{Colors.YELLOW}[WARNING]{Colors.END} {message}")
+        with self._print_lock:
+            print(f"{Colors.YELLOW}[WARNING]{Colors.END} {message}")
     
     def discover_bcm_headnodes(self) -> List[str]:
         """Discover BCM headnodes using cmsh command"""
@@ -55,35 +126,18 @@ class BCMRoleMonitorDeployer:
         
         try:
             self.log("Discovering BCM headnodes using cmsh...")
-            result = subprocess.run(
-                ['cmsh', '-c', 'device list --type headnode'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
+            headnodes = list(_cmsh_headnodes())
             
-            if result.returncode == 0:
-                # Parse the output to extract hostnames
-                lines = result.stdout.strip().split('\n')
-                for line in lines:
-                    line = line.strip()
-                    # Skip header lines and empty lines
-                    if line and not line.startswith('Name') and not line.startswith('---'):
-                        # Extract actual hostname (second column) not BCM internal name
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            hostname = parts[1]  # Second column is the actual hostname
-                            if hostname and hostname not in headnodes:
-                                headnodes.append(hostname)
-                                self.success(f"Discovered BCM headnode: {hostname}")
-                
-                if headnodes:
-                    self.success(f"Found {len(headnodes)} BCM headnode(s)")
-                else:
-                    self.warning("No headnodes found in cmsh output")
+            for hostname in headnodes:
+                self.success(f"Discovered BCM headnode: {hostname}")
+            
+            if headnodes:
+                self.success(f"Found {len(headnodes)} BCM headnode(s)")
             else:
-                self.error(f"cmsh command failed: {result.stderr}")
+                self.warning("No headnodes found in cmsh output")
                 
+        except subprocess.CalledProcessError as e:
+            self.error(f"cmsh command failed: {e.stderr}")
         except subprocess.TimeoutExpired:
             self.error("cmsh command timed out")
         except FileNotFoundError:
@@ -106,11 +160,38 @@ class BCMRoleMonitorDeployer:
         }
         return config
     
+    def _ssh_opts(self) -> List[str]:
+        """SSH options that multiplex every ssh/scp to a host over one connection"""
+        with self._ssh_ctl_lock:
+            if self.ssh_ctl_dir is None:
+                self.ssh_ctl_dir = tempfile.mkdtemp(prefix='bcm-deploy-ssh-')
+        return [
+            '-o', f'ControlPath={self.ssh_ctl_dir}/%C',
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPersist=60s'
+        ]
+    
+    def _close_ssh_master(self, hostname: str):
+        """Shut down the multiplexed SSH master connection to a host"""
+        if self.ssh_ctl_dir is None:
+            return
+        subprocess.run(
+            ['ssh', *self._ssh_opts(), '-O', 'exit', hostname],
+            capture_output=True
+        )
+    
+    def close(self):
+        """Remove the SSH control socket directory, if one was created"""
+        with self._ssh_ctl_lock:
+            ctl_dir, self.ssh_ctl_dir = self.ssh_ctl_dir, None
+        if ctl_dir is not None:
+            shutil.rmtree(ctl_dir, ignore_errors=True)
+    
     def test_ssh_connectivity(self, hostname: str) -> bool:
         """Test SSH connectivity to a host"""
         try:
             result = subprocess.run(
-                ['ssh', '-o', 'ConnectTimeout=5', '-o', 'BatchMode=yes', 
+                ['ssh', *self._ssh_opts(), '-o', 'ConnectTimeout=5', '-o', 'BatchMode=yes', 
                  hostname, 'echo "SSH test successful"'],
                 capture_output=True,
                 text=True,
@@ -120,44 +201,75 @@ class BCMRoleMonitorDeployer:
         except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
             return False
     
+    def _install_files_on_dgx(self, dgx_node: str, files: List[Tuple[bytes, str, str]],
+                              setup_cmd: str = None):
+        """Stream files to a DGX node over one ssh session and install them in place
+        
+        Args:
+            dgx_node: Target host
+            files: (content, remote path, octal mode) for each file
+            setup_cmd: Optional remote command to run before installing
+        """
+        install_cmds = [
+            f'install -D -m {mode} "$stage/{index}" {remote_path}'
+            for index, (_, remote_path, mode) in enumerate(files)
+        ]
+        remote_cmd = (
+            'stage=$(mktemp -d) && trap \'rm -rf "$stage"\' EXIT && '
+            'tar -xf - -C "$stage" && ' + ' && '.join(install_cmds)
+        )
+        if setup_cmd:
+            remote_cmd = f'{setup_cmd} && {remote_cmd}'
+        
+        proc = subprocess.Popen(['ssh', *self._ssh_opts(), dgx_node, remote_cmd], stdin=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode='w|') as tar:
+                for index, (content, _, _) in enumerate(files):
+                    info = tarfile.TarInfo(str(index))
+                    info.size = len(content)
+                    info.mode = 0o600
+                    tar.addfile(info, io.BytesIO(content))
+        except BrokenPipeError:
+            # Remote side exited early; the return code below reports the failure
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, ['ssh', dgx_node, remote_cmd])
+    
     def copy_files_to_dgx(self, dgx_node: str) -> bool:
-        """Copy BCM role monitor files to a DGX node"""
+        """Copy BCM role monitor files and BCM certificates to a DGX node"""
         try:
-            self.log(f"Copying files to {dgx_node}...")
+            self.log(f"Copying files and BCM certificates to {dgx_node}...")
             
-            # Create remote directories
-            subprocess.run([
-                'ssh', dgx_node, 
-                'mkdir -p /usr/local/bin /etc/bcm-role-monitor /var/lib/bcm-role-monitor /var/log /cm/shared/apps/jobstats/prometheus-targets'
-            ], check=True)
+            # Check if certificates exist locally
+            cert_files = ['/root/.cm/admin.pem', '/root/.cm/admin.key']
+            for cert_file in cert_files:
+                if not Path(cert_file).exists():
+                    self.error(f"BCM certificate not found: {cert_file}")
+                    return False
             
-            # Copy Python script
+            # Python script
             src_script = self.script_dir / 'bcm_role_monitor.py'
             if not src_script.exists():
                 self.error(f"Source script not found: {src_script}")
                 return False
             
-            subprocess.run([
-                'scp', str(src_script), f'{dgx_node}:/usr/local/bin/'
-            ], check=True)
-            
-            # Make script executable
-            subprocess.run([
-                'ssh', dgx_node, 'chmod +x /usr/local/bin/bcm_role_monitor.py'
-            ], check=True)
-            
-            # Copy or generate systemd service
+            # Systemd service
             src_service = self.script_dir / 'bcm-role-monitor.service'
             if not src_service.exists():
                 self.error(f"Source service file not found: {src_service}")
                 return False
             
+            with open(src_service, 'r') as f:
+                service_content = f.read()
+            
             # If custom prometheus_targets_dir is specified, generate custom service file
             if hasattr(self, 'prometheus_targets_dir') and self.prometheus_targets_dir:
-                # Read the template service file
-                with open(src_service, 'r') as f:
-                    service_content = f.read()
-                
                 # Modify ExecStart to include --prometheus-targets-dir
                 service_content = service_content.replace(
                     'ExecStart=/usr/bin/python3 /usr/local/bin/bcm_role_monitor.py',
@@ -169,27 +281,19 @@ class BCMRoleMonitorDeployer:
                     'ReadWritePaths=/var/lib/bcm-role-monitor /var/log /etc/bcm-role-monitor /cm/shared/apps/jobstats/prometheus-targets',
                     f'ReadWritePaths=/var/lib/bcm-role-monitor /var/log /etc/bcm-role-monitor {self.prometheus_targets_dir}'
                 )
-                
-                # Write to temporary file
-                import tempfile
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.service', delete=False) as tmp_service:
-                    tmp_service.write(service_content)
-                    tmp_service_path = tmp_service.name
-                
-                try:
-                    # Copy the modified service file
-                    subprocess.run([
-                        'scp', tmp_service_path, f'{dgx_node}:/etc/systemd/system/bcm-role-monitor.service'
-                    ], check=True)
-                finally:
-                    # Clean up temp file
-                    import os
-                    os.unlink(tmp_service_path)
-            else:
-                # Copy the default service file
-                subprocess.run([
-                    'scp', str(src_service), f'{dgx_node}:/etc/systemd/system/bcm-role-monitor.service'
-                ], check=True)
+            
+            # Create remote directories and install all files in one tar-over-ssh stream;
+            # certificates go to the service directory, readable only by root
+            self._install_files_on_dgx(
+                dgx_node,
+                [
+                    (src_script.read_bytes(), '/usr/local/bin/bcm_role_monitor.py', '0755'),
+                    (service_content.encode(), '/etc/systemd/system/bcm-role-monitor.service', '0644'),
+                    (Path('/root/.cm/admin.pem').read_bytes(), '/etc/bcm-role-monitor/admin.pem', '0600'),
+                    (Path('/root/.cm/admin.key').read_bytes(), '/etc/bcm-role-monitor/admin.key', '0600'),
+                ],
+                setup_cmd='mkdir -p /usr/local/bin /etc/bcm-role-monitor /var/lib/bcm-role-monitor /var/log /cm/shared/apps/jobstats/prometheus-targets'
+            )
             
             return True
             
@@ -202,59 +306,16 @@ class BCMRoleMonitorDeployer:
         try:
             self.log(f"Deploying configuration to {dgx_node}...")
             
-            # Create temporary config file locally
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-                json.dump(config, temp_file, indent=2)
-                temp_config_path = temp_file.name
-            
-            try:
-                # Copy config file to remote host
-                subprocess.run([
-                    'scp', temp_config_path, f'{dgx_node}:/etc/bcm-role-monitor/config.json'
-                ], check=True)
-                
-                return True
-                
-            finally:
-                # Clean up temporary file
-                import os
-                os.unlink(temp_config_path)
-            
-        except subprocess.CalledProcessError as e:
-            self.error(f"Failed to deploy config to {dgx_node}: {e}")
-            return False
-    
-    def copy_bcm_certificates_to_dgx(self, dgx_node: str) -> bool:
-        """Copy BCM certificates to DGX node"""
-        try:
-            self.log(f"Copying BCM certificates to {dgx_node}...")
-            
-            # Check if certificates exist locally
-            cert_files = ['/root/.cm/admin.pem', '/root/.cm/admin.key']
-            for cert_file in cert_files:
-                if not Path(cert_file).exists():
-                    self.error(f"BCM certificate not found: {cert_file}")
-                    return False
-            
-            # Copy certificates to service directory
-            subprocess.run([
-                'scp', '/root/.cm/admin.pem', f'{dgx_node}:/etc/bcm-role-monitor/admin.pem'
-            ], check=True)
-            
+            # Stream config to the remote host; install sets the mode as it writes
             subprocess.run([
-                'scp', '/root/.cm/admin.key', f'{dgx_node}:/etc/bcm-role-monitor/admin.key'
-            ], check=True)
-            
-            # Set proper permissions (readable only by root)
-            subprocess.run([
-                'ssh', dgx_node, 'chmod 600 /etc/bcm-role-monitor/admin.pem /etc/bcm-role-monitor/admin.key'
-            ], check=True)
+                'ssh', *self._ssh_opts(), dgx_node,
+                'install -m 644 /dev/stdin /etc/bcm-role-monitor/config.json'
+            ], input=json.dumps(config, indent=2).encode(), check=True)
             
             return True
             
         except subprocess.CalledProcessError as e:
-            self.error(f"Failed to copy certificates to {dgx_node}: {e}")
+            self.error(f"Failed to deploy config to {dgx_node}: {e}")
             return False
     
     def enable_and_start_service_on_dgx(self, dgx_node: str) -> bool:
@@ -262,64 +323,60 @@ class BCMRoleMonitorDeployer:
         try:
             self.log(f"Enabling and starting service on {dgx_node}...")
             
-            # Reload systemd
-            subprocess.run([
-                'ssh', dgx_node, 'systemctl daemon-reload'
-            ], check=True)
-            
-            # Enable service
-            subprocess.run([
-                'ssh', dgx_node, 'systemctl enable bcm-role-monitor.service'
-            ], check=True)
-            
-            # Start service
-            subprocess.run([
-                'ssh', dgx_node, 'systemctl start bcm-role-monitor.service'
-            ], check=True)
-            
-            # Check if service is running
+            # Reload systemd, enable and start the service, then check it is running
             result = subprocess.run([
-                'ssh', dgx_node, 'systemctl is-active --quiet bcm-role-monitor.service'
-            ], capture_output=True)
+                'ssh', *self._ssh_opts(), dgx_node,
+                'systemctl daemon-reload && '
+                'systemctl enable bcm-role-monitor.service && '
+                'systemctl start bcm-role-monitor.service && '
+                'systemctl is-active --quiet bcm-role-monitor.service'
+            ], capture_output=True, text=True)
             
             if result.returncode == 0:
                 self.success(f"BCM role monitor service is running on {dgx_node}")
                 return True
             else:
-                self.error(f"BCM role monitor service failed to start on {dgx_node}")
+                self.error(f"BCM role monitor service failed to start on {dgx_node}: {result.stderr.strip()}")
                 return False
             
         except subprocess.CalledProcessError as e:
             self.error(f"Failed to enable/start service on {dgx_node}: {e}")
             return False
     
-    def deploy_to_dgx_node(self, dgx_node: str, bcm_headnodes: List[str]) -> bool:
-        """Deploy BCM role monitor to a single DGX node"""
+    def deploy_to_dgx_node(self, dgx_node: str, bcm_headnodes: List[str],
+                           check_ssh: bool = True) -> bool:
+        """Deploy BCM role monitor to a single DGX node
+        
+        Args:
+            dgx_node: DGX node hostname
+            bcm_headnodes: BCM headnodes to configure on the node
+            check_ssh: Test SSH connectivity first (skip if already probed)
+        """
         self.log(f"Deploying BCM role monitor to {dgx_node}...")
         
-        # Test SSH connectivity
-        if not self.test_ssh_connectivity(dgx_node):
+        # Test SSH connectivity (this also opens the shared master connection)
+        if check_ssh and not self.test_ssh_connectivity(dgx_node):
             self.error(f"Cannot connect to {dgx_node} via SSH")
             return False
         
-        # Create configuration
-        config = self.create_config_for_dgx(bcm_headnodes)
-        
-        # Deploy components
-        if not self.copy_files_to_dgx(dgx_node):
-            return False
-        
-        if not self.deploy_config_to_dgx(dgx_node, config):
-            return False
-        
-        if not self.copy_bcm_certificates_to_dgx(dgx_node):
-            return False
-        
-        if not self.enable_and_start_service_on_dgx(dgx_node):
-            return False
-        
-        self.success(f"Successfully deployed BCM role monitor to {dgx_node}")
-        return True
+        try:
+            # Create configuration
+            config = self.create_config_for_dgx(bcm_headnodes)
+            
+            # Deploy components
+            if not self.copy_files_to_dgx(dgx_node):
+                return False
+            
+            if not self.deploy_config_to_dgx(dgx_node, config):
+                return False
+            
+            if not self.enable_and_start_service_on_dgx(dgx_node):
+                return False
+            
+            self.success(f"Successfully deployed BCM role monitor to {dgx_node}")
+            return True
+        finally:
+            self._close_ssh_master(dgx_node)
     
     def deploy(self, prometheus_targets_dir: str = None) -> bool:
         """Main deployment process
@@ -327,6 +384,13 @@ class BCMRoleMonitorDeployer:
         Args:
             prometheus_targets_dir: Optional custom Prometheus targets directory
         """
+        try:
+            return self._deploy(prometheus_targets_dir)
+        finally:
+            self.close()
+    
+    def _deploy(self, prometheus_targets_dir: str = None) -> bool:
+        """Deploy to all DGX nodes; deploy() cleans up the SSH control directory afterwards"""
         self.log("Starting BCM Role Monitor deployment...")
         
         # Store prometheus_targets_dir for use in deployment
@@ -347,13 +411,37 @@ class BCMRoleMonitorDeployer:
         if prometheus_targets_dir:
             self.log(f"Using custom Prometheus targets directory: {prometheus_targets_dir}")
         
-        # Deploy to each DGX node
+        max_workers = max(1, min(len(self.dgx_nodes), self.max_workers))
+        
+        # Probe SSH connectivity to all nodes up front so unreachable nodes cost one timeout in total
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            probes = executor.map(self.test_ssh_connectivity, self.dgx_nodes)
+            reachable_nodes = []
+            for dgx_node, reachable in zip(self.dgx_nodes, probes):
+                if reachable:
+                    reachable_nodes.append(dgx_node)
+                else:
+                    self.error(f"Cannot connect to {dgx_node} via SSH")
+        
+        # Deploy to reachable DGX nodes concurrently; each node's work is independent and SSH-bound
         success_count = 0
-        for dgx_node in self.dgx_nodes:
-            if self.deploy_to_dgx_node(dgx_node, bcm_headnodes):
-                success_count += 1
-            else:
-                self.error(f"Failed to deploy to {dgx_node}")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.deploy_to_dgx_node, dgx_node, bcm_headnodes, False): dgx_node
+                for dgx_node in reachable_nodes
+            }
+            for future in as_completed(futures):
+                dgx_node = futures[future]
+                try:
+                    deployed = future.result()
+                except Exception as e:
+                    self.error(f"Unexpected error deploying to {dgx_node}: {e}")
+                    deployed = False
+                
+                if deployed:
+                    success_count += 1
+                else:
+                    self.error(f"Failed to deploy to {dgx_node}")
         
         # Summary
         if success_count == len(self.dgx_nodes):
@@ -373,6 +461,8 @@ def main():
     parser = argparse.ArgumentParser(description='Deploy BCM Role Monitor to DGX nodes')
     parser.add_argument('--config', help='Configuration file path')
     parser.add_argument('--dgx-nodes', nargs='+', help='DGX node hostnames')
+    parser.add_argument('--max-workers', type=int,
+                        help='Number of DGX nodes to deploy to concurrently (default: 32)')
     
     args = parser.parse_args()
     
@@ -384,6 +474,9 @@ def main():
     if args.dgx_nodes:
         config['dgx_nodes'] = args.dgx_nodes
     
+    if args.max_workers:
+        config['deploy_max_workers'] = args.max_workers
+    
     deployer = BCMRoleMonitorDeployer(config)
     
     try:
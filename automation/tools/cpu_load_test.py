@@ -6,6 +6,7 @@ This script generates a sustained CPU load to test jobstats CPU metrics collecti
 It uses multiple processes to create realistic CPU utilization patterns.
 """
 
+import math
 import os
 import sys
 import time
@@ -13,49 +14,118 @@ import multiprocessing
 import argparse
 from datetime import datetime
 
-def cpu_intensive_task(process_id, duration, intensity=100):
-    """Generate CPU-intensive workload"""
+# Use NumPy for a vectorized (SIMD) kernel when available
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+    np = None
+
+# Use Numba for a compiled kernel that saturates the FPU when available
+try:
+    import numba
+    HAS_NUMBA = HAS_NUMPY
+except ImportError:
+    HAS_NUMBA = False
+    numba = None
+
+if HAS_NUMBA:
+    @numba.njit(cache=True, fastmath=True, boundscheck=False)
+    def _burn(values):
+        """Sum of square roots, compiled to vectorized machine code"""
+        total = 0.0
+        for i in range(values.size):
+            total += math.sqrt(values[i])
+        return total
+
+def resolve_engine(engine):
+    """Return the best available engine, falling back numba -> numpy -> python"""
+    if engine == 'auto':
+        engine = 'numpy'
+    if engine == 'numba' and not HAS_NUMBA:
+        print("Numba not available, falling back to NumPy")
+        engine = 'numpy'
+    if engine == 'numpy' and not HAS_NUMPY:
+        print("NumPy not available, falling back to pure Python")
+        engine = 'python'
+    return engine
+
+def cpu_intensive_task(process_id, duration, intensity=100, core=None, engine='python'):
+    """Generate CPU-intensive workload, optionally pinned to a single core"""
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+        print(f"Process {process_id} pinned to core {core}")
     print(f"Process {process_id} starting CPU intensive task for {duration} seconds")
     
-    start_time = time.time()
+    # Monotonic deadline, unaffected by wall-clock adjustments during the test
+    deadline = time.monotonic() + duration
     iterations = 0
+    chunk_size = intensity * 1000
+    
+    if engine != 'python':
+        values = np.arange(chunk_size, dtype=np.float64)
+        roots = np.empty_like(values)
+        # Number of 100000-element blocks per pass, matching the scalar loop's accounting
+        blocks_per_pass = (chunk_size + 99999) // 100000
+        # A pass takes well under a millisecond, so report progress by time, not by pass
+        next_report = time.monotonic() + 1
     
-    while time.time() - start_time < duration:
+    while time.monotonic() < deadline:
         # CPU-intensive mathematical operations
-        result = 0
-        for i in range(intensity * 1000):
-            result += i ** 0.5
-            if i % 100000 == 0:
-                iterations += 1
-                if iterations % 10 == 0:
-                    print(f"Process {process_id}: {iterations * 100000} iterations completed")
+        if engine == 'python':
+            result = 0
+            for i in range(chunk_size):
+                result += i ** 0.5
+                if i % 100000 == 0:
+                    iterations += 1
+                    if iterations % 10 == 0:
+                        print(f"Process {process_id}: {iterations * 100000} iterations completed")
+        else:
+            if engine == 'numba':
+                result = _burn(values)
+            else:
+                result = np.sqrt(values, out=roots).sum()
+            iterations += blocks_per_pass
+            now = time.monotonic()
+            if now >= next_report:
+                print(f"Process {process_id}: {iterations * 100000} iterations completed")
+                next_report = now + 1
     
     print(f"Process {process_id} completed {iterations * 100000} iterations")
 
 def main():
     parser = argparse.ArgumentParser(description='Generate CPU load for jobstats testing')
     parser.add_argument('--duration', type=int, default=60, help='Duration in seconds (default: 60)')
-    parser.add_argument('--processes', type=int, default=4, help='Number of processes (default: 4)')
+    parser.add_argument('--processes', type=int, default=len(os.sched_getaffinity(0)),
+                        help='Number of processes (default: number of CPUs available to this job)')
+    parser.add_argument('--pin', action='store_true', help='Pin each process to its own core')
     parser.add_argument('--intensity', type=int, default=100, help='CPU intensity multiplier (default: 100)')
+    parser.add_argument('--engine', choices=['auto', 'python', 'numpy', 'numba'], default='auto',
+                        help='Compute kernel (default: auto, NumPy if installed, else pure Python)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
     
     args = parser.parse_args()
+    engine = resolve_engine(args.engine)
     
     print(f"Starting CPU load test:")
     print(f"  Duration: {args.duration} seconds")
     print(f"  Processes: {args.processes}")
     print(f"  Intensity: {args.intensity}")
+    print(f"  Engine: {engine}")
     print(f"  Job ID: {os.environ.get('SLURM_JOB_ID', 'N/A')}")
     print(f"  Node: {os.environ.get('SLURM_NODELIST', 'N/A')}")
     print(f"  Start time: {datetime.now()}")
     print("-" * 50)
     
-    # Create and start processes
+    # Create and start processes, cycling through the allowed cores when pinning
+    cores = sorted(os.sched_getaffinity(0))
     processes = []
     for i in range(args.processes):
+        core = cores[i % len(cores)] if args.pin else None
         p = multiprocessing.Process(
             target=cpu_intensive_task, 
-            args=(i, args.duration, args.intensity)
+            args=(i, args.duration, args.intensity, core, engine)
         )
         p.start()
         processes.append(p)
@@ -10,30 +10,43 @@ at /cm/shared/apps/jobstats/output_formatters.py.
 """
 
 import os
+import re
 import sys
 import shutil
 from datetime import datetime
 
+# Matches the alloc/cores division, tolerating whitespace differences
+ALLOC_RE = re.compile(r'hb_alloc\s*=\s*self\.human_bytes\(alloc\s*/\s*cores\)\.replace\("\.0GB",\s*"GB"\)')
+# Comment inserted by the fix, present once it has been applied
+ALLOC_FIXED_MARKER = '# Handle string alloc values'
+
 def fix_jobstats_alloc_cores():
     """Fix the alloc/cores division error in jobstats"""
     
     jobstats_file = "/cm/shared/apps/jobstats/output_formatters.py"
     backup_file = f"/cm/shared/apps/jobstats/output_formatters.py.backup.alloc_cores.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    if not os.path.exists(jobstats_file):
+    # Read the file
+    try:
+        with open(jobstats_file, 'r') as f:
+            content = f.read()
+    except FileNotFoundError:
         print(f"Error: {jobstats_file} not found")
         return False
     
-    # Create backup
-    print(f"Creating backup: {backup_file}")
-    shutil.copy2(jobstats_file, backup_file)
+    # Nothing to do (and no backup needed) if a previous run already patched it
+    if ALLOC_FIXED_MARKER in content:
+        print("Fix already applied - no changes needed")
+        return True
     
-    # Read the file
-    with open(jobstats_file, 'r') as f:
-        content = f.read()
+    # Create backup (a hardlink is enough since the file is replaced, not rewritten)
+    print(f"Creating backup: {backup_file}")
+    try:
+        os.link(jobstats_file, backup_file)
+    except OSError:
+        shutil.copy2(jobstats_file, backup_file)
     
     # Find and fix the problematic line
-    old_line = 'hb_alloc = self.human_bytes(alloc / cores).replace(".0GB", "GB")'
     new_line = '''# Handle string alloc values
         try:
             alloc_value = float(alloc) if isinstance(alloc, str) else alloc
@@ -41,29 +54,45 @@ def fix_jobstats_alloc_cores():
         except (ValueError, TypeError, ZeroDivisionError):
             hb_alloc = "Unknown"'''
     
-    if old_line in content:
-        content = content.replace(old_line, new_line)
+    content, count = ALLOC_RE.subn(lambda match: new_line, content)
+    if count:
         print("Fixed alloc/cores division error")
     else:
         print("Warning: Could not find the exact line to fix")
         print("Looking for similar patterns...")
         
-        # Look for similar patterns
-        lines = content.split('\n')
-        for i, line in enumerate(lines):
-            if 'alloc / cores' in line and 'human_bytes' in line:
-                print(f"Found similar line at {i+1}: {line.strip()}")
-                lines[i] = new_line
-                content = '\n'.join(lines)
-                print("Applied fix to similar pattern")
-                break
+        # Locate only the line around the first 'alloc / cores' instead of splitting the file
+        pos = content.find('alloc / cores')
+        line_start = content.rfind('\n', 0, pos) + 1
+        line_end = content.find('\n', pos)
+        if line_end == -1:
+            line_end = len(content)
+        line = content[line_start:line_end]
+        
+        if pos != -1 and 'human_bytes' in line:
+            line_number = content.count('\n', 0, line_start) + 1
+            print(f"Found similar line at {line_number}: {line.strip()}")
+            # Keep the line's indentation
+            code_start = line_start + len(line) - len(line.lstrip())
+            content = content[:code_start] + new_line + content[line_end:]
+            print("Applied fix to similar pattern")
         else:
             print("No similar patterns found")
             return False
     
-    # Write the fixed content
-    with open(jobstats_file, 'w') as f:
+    # Refuse to install a patched file that is no longer valid Python
+    try:
+        compile(content, jobstats_file, 'exec')
+    except SyntaxError as e:
+        print(f"Error: Patched file would not compile, leaving it unchanged: {e}")
+        return False
+    
+    # Write the fixed content to a temp file, then atomically replace the original
+    temp_file = f"{jobstats_file}.tmp"
+    with open(temp_file, 'w') as f:
         f.write(content)
+    shutil.copymode(jobstats_file, temp_file)
+    os.replace(temp_file, jobstats_file)
     
     print(f"Successfully fixed {jobstats_file}")
     return True
@@ -18,65 +18,111 @@ Note: This script now works with the shared storage jobstats installation.
 """
 
 import os
+import re
 import shutil
 import subprocess
 import sys
 
+# Time limit comparison that fails when timelimitraw is "UNLIMITED"
+TIMELIMIT_CMP = 'if self.js.state == "COMPLETED" and self.js.timelimitraw > 0:'
+# Time limit formatting that fails when timelimitraw is "UNLIMITED"
+TIMELIMIT_HS = 'hs = self.human_seconds(SECONDS_PER_MINUTE * self.js.timelimitraw)'
+# Both are plain literals, so find them together in a single pass over the file
+TIMELIMIT_RE = re.compile('|'.join(re.escape(line) for line in (TIMELIMIT_CMP, TIMELIMIT_HS)))
+# Code inserted by each fix, present once that fix has been applied
+TIMELIMIT_FIXED_MARKERS = {
+    TIMELIMIT_CMP: 'str(self.js.timelimitraw) != "UNLIMITED"',
+    TIMELIMIT_HS: '# Handle UNLIMITED time limit'
+}
+
 def fix_timelimit_parsing():
     """Fix the timelimit parsing issues in jobstats output_formatters.py"""
     
     file_path = "/cm/shared/apps/jobstats/output_formatters.py"
     backup_path = "/cm/shared/apps/jobstats/output_formatters.py.backup.timelimit_fix"
     
-    # Check if file exists
-    if not os.path.exists(file_path):
+    # Read the file
+    try:
+        with open(file_path, 'r') as f:
+            content = f.read()
+    except FileNotFoundError:
         print(f"ERROR: {file_path} not found")
         return False
     
-    # Create backup
+    # Fixes a previous run already applied are skipped; re-running would otherwise wrap
+    # the already-fixed formatting line again. Nothing to do (and no backup needed) if both are in.
+    already_fixed = {line for line, marker in TIMELIMIT_FIXED_MARKERS.items() if marker in content}
+    if len(already_fixed) == len(TIMELIMIT_FIXED_MARKERS):
+        print("No changes needed - fixes already applied")
+        return True
+    
+    # Create backup (a hardlink is enough since the file is replaced, not rewritten)
     try:
-        shutil.copy2(file_path, backup_path)
+        if os.path.lexists(backup_path):
+            os.remove(backup_path)
+        try:
+            os.link(file_path, backup_path)
+        except OSError:
+            shutil.copy2(file_path, backup_path)
         print(f"Created backup: {backup_path}")
     except Exception as e:
         print(f"ERROR: Failed to create backup: {e}")
         return False
     
     try:
-        # Read the file
-        with open(file_path, 'r') as f:
-            content = f.read()
-        
         original_content = content
         
         # Fix 1: Handle string comparison in time_limit_formatted method
-        old_comparison = 'if self.js.state == "COMPLETED" and self.js.timelimitraw > 0:'
         new_comparison = 'if self.js.state == "COMPLETED" and str(self.js.timelimitraw) != "UNLIMITED" and self.js.timelimitraw > 0:'
         
-        if old_comparison in content:
-            content = content.replace(old_comparison, new_comparison)
-            print("Fixed time limit comparison (string vs int)")
-        else:
-            print("Warning: Could not find time limit comparison to fix")
-        
         # Fix 2: Handle UNLIMITED time limit in time_limit_formatted method
-        old_hs_line = 'hs = self.human_seconds(SECONDS_PER_MINUTE * self.js.timelimitraw)'
         new_hs_code = '''# Handle UNLIMITED time limit
         if self.js.timelimitraw == "UNLIMITED" or str(self.js.timelimitraw).upper() == "UNLIMITED":
             hs = "UNLIMITED"
         else:
             hs = self.human_seconds(SECONDS_PER_MINUTE * self.js.timelimitraw)'''
         
-        if old_hs_line in content:
-            content = content.replace(old_hs_line, new_hs_code)
+        replacements = {TIMELIMIT_CMP: new_comparison, TIMELIMIT_HS: new_hs_code}
+        fixed = set()
+        
+        def apply_fix(match):
+            line = match.group(0)
+            if line in already_fixed:
+                return line
+            fixed.add(line)
+            return replacements[line]
+        
+        content = TIMELIMIT_RE.sub(apply_fix, content)
+        
+        if TIMELIMIT_CMP in already_fixed:
+            print("Time limit comparison already fixed")
+        elif TIMELIMIT_CMP in fixed:
+            print("Fixed time limit comparison (string vs int)")
+        else:
+            print("Warning: Could not find time limit comparison to fix")
+        
+        if TIMELIMIT_HS in already_fixed:
+            print("Time limit formatting already fixed")
+        elif TIMELIMIT_HS in fixed:
             print("Fixed time limit formatting (UNLIMITED handling)")
         else:
             print("Warning: Could not find time limit formatting line to fix")
         
         # Only write if changes were made
         if content != original_content:
-            # Write the fixed file
-            with open(file_path, 'w') as f:
+            # Refuse to install a patched file that is no longer valid Python
+            try:
+                compile(content, file_path, 'exec')
+            except SyntaxError as e:
+                print(f"ERROR: Patched file would not compile, leaving it unchanged: {e}")
+                return False
+            
+            # Write the fixed file to a temp file, then atomically replace the original
+            temp_path = f"{file_path}.tmp"
+            with open(temp_path, 'w') as f:
                 f.write(content)
+            shutil.copymode(file_path, temp_path)
+            os.replace(temp_path, file_path)
             print("Successfully applied jobstats timelimit fixes")
             return True
         else:
@@ -87,7 +133,9 @@ def fix_timelimit_parsing():
         print(f"ERROR: Failed to apply fixes: {e}")
         print("Restoring from backup...")
         try:
-            shutil.copy2(backup_path, file_path)
+            # The original is only replaced as the last step, so it may still be the backup's inode
+            if not os.path.samefile(backup_path, file_path):
+                shutil.copy2(backup_path, file_path)
             print("Restored from backup")
         except Exception as restore_error:
             print(f"ERROR: Failed to restore from backup: {restore_error}")
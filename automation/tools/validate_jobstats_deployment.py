@@ -12,14 +12,54 @@ Usage:
 
 import argparse
 import json
+import re
+import shlex
+import shutil
 import subprocess
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
+import urllib.parse
 import urllib.request
 import urllib.error
 
+# Use orjson for faster parsing of Prometheus API payloads when available
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+    orjson = None
+
+
+# A "Key=Value" line in slurm.conf, e.g. "TaskPlugin = affinity,cgroup"
+SLURM_CONF_SETTING_RE = re.compile(r'^(\w+)\s*=\s*(.*)$', re.MULTILINE)
+
+# BCM's prolog/epilog wrappers, expected in the wlm prolog/epilog settings
+BCM_PROLOG = "/cm/local/apps/cmd/scripts/prolog"
+BCM_EPILOG = "/cm/local/apps/cmd/scripts/epilog"
+# Job summary epilog run by slurmctld
+SLURMCTLD_EPILOG = "/usr/local/sbin/slurmctldepilog.sh"
+# Jobstats prolog/epilog on shared storage
+SHARED_PROLOG_SCRIPT = "/cm/shared/apps/slurm/var/cm/prolog-jobstats.sh"
+SHARED_EPILOG_SCRIPT = "/cm/shared/apps/slurm/var/cm/epilog-jobstats.sh"
+# Per-node symlinks to the shared jobstats prolog/epilog
+PROLOG_SCRIPT = "/cm/local/apps/slurm/var/prologs/60-prolog-jobstats.sh"
+EPILOG_SCRIPT = "/cm/local/apps/slurm/var/epilogs/60-epilog-jobstats.sh"
+# Labels every node_exporter / cgroup_exporter series must carry (based on actual exporter output)
+NODE_EXPORTER_LABELS = ('instance', 'job', 'nodename')
+CGROUP_EXPORTER_LABELS = ('jobid', 'cluster', 'instance', 'job')
+
+
+def _json_loads(data):
+    """Deserialize JSON text or bytes (orjson errors subclass json.JSONDecodeError)."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class Colors:
     """ANSI color codes for terminal output."""
@@ -34,11 +74,34 @@ class Colors:
 class JobstatsValidator:
     """Validates jobstats deployment across all nodes."""
     
-    def __init__(self, config_file: str = "automation/configs/config.json", verbose: bool = False):
+    # Colored result labels, built once rather than per test
+    PASS = f"{Colors.GREEN}✅ PASS{Colors.END}"
+    FAIL = f"{Colors.RED}❌ FAIL{Colors.END}"
+    WARN = f"{Colors.YELLOW}⚠️  WARNING{Colors.END}"
+    
+    def __init__(self, config_file: str = "automation/configs/config.json", verbose: bool = False,
+                 max_workers: int = 32, command_timeout: int = 30):
         """Initialize the validator with configuration."""
         self.config_file = config_file
         self.verbose = verbose
+        self.max_workers = max_workers
+        self.command_timeout = command_timeout
+        # Trivial probes (systemctl, ss, test) finish in well under a second once connected
+        self.probe_timeout = min(command_timeout, 10)
         self.config = self._load_config()
+        # Control sockets for multiplexing every ssh to a host over one connection
+        self.ssh_ctl_dir = tempfile.mkdtemp(prefix='jobstats-validate-ssh-')
+        self.ssh_hosts = set()
+        # Hosts that failed the initial SSH connection; their checks fail without retrying
+        self._unreachable_hosts = set()
+        # Prometheus API responses by path, reused for the rest of the run
+        self._prometheus_cache = {}
+        # Listening TCP ports by host, from one ss call per host
+        self._listening_ports = {}
+        # test(1) results by (host, flag, path), so repeated probes within a run are free
+        self._path_test_cache = {}
+        # Service state by (service, host) from validate_services, so dependent checks can skip early
+        self._service_status = {}
         self.results = {
             'passed': 0,
             'failed': 0,
@@ -49,8 +112,8 @@ class JobstatsValidator:
     def _load_config(self) -> Dict:
         """Load configuration from JSON file."""
         try:
-            with open(self.config_file, 'r') as f:
-                config = json.load(f)
+            with open(self.config_file, 'rb') as f:
+                config = _json_loads(f.read())
             self._log(f"Loaded configuration from {self.config_file}", "INFO")
             return config
         except FileNotFoundError:
@@ -95,22 +158,58 @@ class JobstatsValidator:
         else:
             print(f"[{timestamp}] {message}")
     
-    def _run_command(self, command: str, host: Optional[str] = None) -> Tuple[bool, str, str]:
-        """Run a command locally or on a remote host."""
+    def _ssh_opts(self) -> List[str]:
+        """SSH options that multiplex every command to a host over one connection."""
+        return [
+            '-o', f'ControlPath={self.ssh_ctl_dir}/%C',
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPersist=60s'
+        ]
+    
+    def _open_ssh_masters(self):
+        """Open the multiplexed SSH master to every configured host up front, concurrently."""
+        hosts = list(dict.fromkeys(host for hosts in self.config['systems'].values() for host in hosts))
+        results = self._run_parallel(self._run_command, [(['true'], host, self.probe_timeout) for host in hosts])
+        for host, (success, stdout, stderr) in zip(hosts, results):
+            if not success:
+                self._unreachable_hosts.add(host)
+                self._log(f"Cannot reach {host} over SSH, its checks will fail: {stderr.strip()}", "WARNING")
+    
+    def _close_ssh_masters(self):
+        """Shut down the multiplexed SSH master connections opened during validation."""
+        for host in self.ssh_hosts:
+            subprocess.run(['ssh', *self._ssh_opts(), '-O', 'exit', host], capture_output=True)
+        shutil.rmtree(self.ssh_ctl_dir, ignore_errors=True)
+    
+    def _run_command(self, command: Union[str, List[str]], host: Optional[str] = None,
+                     timeout: Optional[int] = None) -> Tuple[bool, str, str]:
+        """Run a command locally or on a remote host.
+        
+        An argv list is executed without a shell; a string is run by the (remote) shell.
+        The timeout defaults to the per-command --timeout.
+        """
+        if host in self._unreachable_hosts:
+            return False, "", f"Host {host} unreachable"
         if host:
-            full_command = f"ssh {host} '{command}'"
+            self.ssh_hosts.add(host)
+            # ssh hands its last argument to the remote shell as-is, so no local quoting is needed
+            remote_command = command if isinstance(command, str) else shlex.join(command)
+            # Fail fast on unreachable hosts or password prompts instead of waiting out the timeout
+            argv = ['ssh', *self._ssh_opts(), '-o', 'ConnectTimeout=5', '-o', 'BatchMode=yes',
+                    host, remote_command]
+        elif isinstance(command, str):
+            argv = ['/bin/sh', '-c', command]
         else:
-            full_command = command
+            argv = command
             
-        self._log(f"Running: {full_command}", "DEBUG")
+        self._log(f"Running: {shlex.join(argv)}", "DEBUG")
         
         try:
             result = subprocess.run(
-                full_command,
-                shell=True,
+                argv,
                 capture_output=True,
                 text=True,
-                timeout=30
+                timeout=timeout or self.command_timeout
             )
             return result.returncode == 0, result.stdout, result.stderr
         except subprocess.TimeoutExpired:
@@ -118,18 +217,58 @@ class JobstatsValidator:
         except Exception as e:
             return False, "", str(e)
     
+    def _run_parallel(self, func, checks: List[Tuple]) -> List:
+        """Run func(*check) for every check concurrently, returning results in input order."""
+        if not checks:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(len(checks), self.max_workers))) as executor:
+            return list(executor.map(lambda check: func(*check), checks))
+    
     def _check_service(self, service: str, host: Optional[str] = None) -> bool:
         """Check if a systemd service is running."""
-        success, stdout, stderr = self._run_command(f"systemctl is-active {service}", host)
-        return success and stdout.strip() == "active"
+        return self._check_services([service], host)[0]
+    
+    def _check_services(self, services: List[str], host: Optional[str] = None) -> List[bool]:
+        """Check several systemd services with one command, returning results in the order given."""
+        # is-active prints one state per unit and exits non-zero if any is inactive, so only parse stdout
+        success, stdout, stderr = self._run_command(['systemctl', 'is-active', *services], host, self.probe_timeout)
+        states = stdout.split()
+        return [index < len(states) and states[index] == "active" for index in range(len(services))]
     
     def _check_port(self, port: int, host: Optional[str] = None) -> bool:
         """Check if a port is listening."""
-        success, stdout, stderr = self._run_command(f"netstat -tlnp | grep ':{port} ' || ss -tlnp | grep ':{port} '", host)
-        return success and stdout.strip() != ""
+        return port in self._get_listening_ports(host)
+    
+    def _get_listening_ports(self, host: Optional[str] = None) -> set:
+        """Return the set of TCP ports listening on a host, fetched once per host.
+        
+        A failed lookup is not cached, so a later check can retry it.
+        """
+        if host in self._listening_ports:
+            return self._listening_ports[host]
+        # -H is missing from older iproute2, and ss itself from some minimal images
+        success, stdout, stderr = self._run_command("ss -tln 2>/dev/null || netstat -tln", host, self.probe_timeout)
+        ports = set()
+        for line in stdout.splitlines():
+            # ss:      State Recv-Q Send-Q Local-Address:Port Peer-Address:Port
+            # netstat: Proto Recv-Q Send-Q Local-Address:Port Foreign-Address State
+            # Header lines never end in a numeric port, so they drop out here
+            fields = line.split()
+            if len(fields) >= 4:
+                port = fields[3].rsplit(':', 1)[-1]
+                if port.isdigit():
+                    ports.add(int(port))
+        if success:
+            self._listening_ports[host] = ports
+        return ports
     
     def _check_metrics_endpoint(self, url: str, host: Optional[str] = None) -> Tuple[bool, str]:
         """Check if a metrics endpoint is responding."""
+        if host and self.config.get('direct_http', False):
+            # Exporter ports are reachable from here, so scrape the host directly instead of via SSH
+            url = url.replace('//localhost:', f'//{host}:', 1)
+            host = None
+        
         if host:
             # For remote hosts, we need to check via SSH
             success, stdout, stderr = self._run_command(f"curl -s {url} | head -1", host)
@@ -140,24 +279,86 @@ class JobstatsValidator:
             # For local host, we can use urllib
             try:
                 with urllib.request.urlopen(url, timeout=10) as response:
-                    content = response.read().decode('utf-8')
-                    if "# HELP" in content:
-                        return True, content.split('\n')[0]
-                    return False, "No metrics found"
+                    # HELP lines lead the exposition, so a bounded prefix is enough; never
+                    # pull the whole (often multi-MB) response, however long its lines are
+                    head = response.read(8192)
+                help_pos = head.find(b"# HELP")
+                if help_pos != -1:
+                    return True, head[help_pos:].split(b"\n", 1)[0].decode('utf-8', 'replace')
+                return False, "No metrics found"
             except Exception as e:
                 return False, str(e)
     
     def _check_file_exists(self, file_path: str, host: Optional[str] = None) -> bool:
         """Check if a file exists."""
-        success, stdout, stderr = self._run_command(f"test -f {file_path}", host)
-        return success
+        return self._check_files_exist([file_path], host)[0]
+    
+    def _check_files_exist(self, file_paths: List[str], host: Optional[str] = None) -> List[bool]:
+        """Check several files with one command, returning results in the order given."""
+        return self._test_paths([('-f', file_path) for file_path in file_paths], host)
+    
+    def _test_paths(self, tests: List[Tuple[str, str]], host: Optional[str] = None) -> List[bool]:
+        """Run several (flag, path) test(1) checks with one command, returning results in the order given."""
+        unknown = [
+            (flag, path) for flag, path in dict.fromkeys(tests)
+            if (host, flag, path) not in self._path_test_cache
+        ]
+        if unknown:
+            # Paths come from the config file, so quote them for the (remote) shell
+            script = "; ".join(
+                f"test {flag} {shlex.quote(path)} && echo 1 || echo 0" for flag, path in unknown
+            )
+            success, stdout, stderr = self._run_command(script, host, self.probe_timeout)
+            found = stdout.split()
+            # Only a complete answer is cached; a timeout or SSH failure reports False for this
+            # call but leaves later checks free to probe again
+            if success and len(found) == len(unknown):
+                for (flag, path), result in zip(unknown, found):
+                    self._path_test_cache[(host, flag, path)] = result == "1"
+        return [self._path_test_cache.get((host, flag, path), False) for flag, path in tests]
+    
+    def _sacct_recent_jobs(self, fields: List[str], host: str) -> Tuple[bool, List[List[str]]]:
+        """Return sacct rows for the last day's jobs, split on sacct's unambiguous '|' delimiter."""
+        start = time.strftime('%Y-%m-%d', time.localtime(time.time() - 86400))
+        success, stdout, stderr = self._run_command(
+            ['sacct', '-S', start, f"--format={','.join(fields)}", '--noheader', '--parsable2'],
+            host
+        )
+        return success, [line.split('|') for line in stdout.splitlines() if line]
+    
+    def _prometheus_get(self, path: str) -> Tuple[bool, str]:
+        """Fetch a Prometheus API path on the Prometheus server, reusing earlier responses."""
+        if not self._prometheus_running():
+            return False, ""
+        if path not in self._prometheus_cache:
+            prometheus_host = self.config['systems']['prometheus_server'][0]
+            if self.config.get('direct_http', False):
+                # Query the API from here, skipping the SSH hop and the remote curl
+                try:
+                    url = f"http://{prometheus_host}:{self.config['prometheus_port']}{path}"
+                    with urllib.request.urlopen(url, timeout=self.command_timeout) as response:
+                        success, stdout = True, response.read().decode('utf-8', 'replace')
+                except Exception:
+                    success, stdout = False, ""
+            else:
+                success, stdout, stderr = self._run_command(
+                    ['curl', '-s', f"http://localhost:{self.config['prometheus_port']}{path}"],
+                    prometheus_host
+                )
+            self._prometheus_cache[path] = (success, stdout)
+        return self._prometheus_cache[path]
+    
+    def _prometheus_running(self) -> bool:
+        """Return False only if validate_services already found Prometheus stopped."""
+        prometheus_host = self.config['systems']['prometheus_server'][0]
+        return self._service_status.get(('prometheus', prometheus_host), True)
     
     def _check_bcm_slurm_configuration(self, host: Optional[str] = None) -> Dict[str, bool]:
         """Check BCM-managed Slurm configuration for jobstats."""
         results = {}
         
         # Check BCM prolog/epilog configuration
-        success, stdout, stderr = self._run_command('cmsh -c "wlm;get prolog;get epilog;get epilogslurmctld"', host)
+        success, stdout, stderr = self._run_command(['cmsh', '-c', 'wlm;get prolog;get epilog;get epilogslurmctld'], host)
         if success:
             # BCM is configured if prolog/epilog point to the correct directories
             # The output has newlines between values, so we check each line
@@ -166,47 +367,38 @@ class JobstatsValidator:
             epilog_line = lines[1] if len(lines) > 1 else ""
             epilogslurmctld_line = lines[2] if len(lines) > 2 else ""
             
-            prolog_configured = "/cm/local/apps/cmd/scripts/prolog" in prolog_line
-            epilog_configured = "/cm/local/apps/cmd/scripts/epilog" in epilog_line
+            prolog_configured = BCM_PROLOG in prolog_line
+            epilog_configured = BCM_EPILOG in epilog_line
             results["BCM prolog/epilog configured"] = prolog_configured and epilog_configured
-            results["BCM epilogslurmctld configured"] = "/usr/local/sbin/slurmctldepilog.sh" in epilogslurmctld_line
+            results["BCM epilogslurmctld configured"] = SLURMCTLD_EPILOG in epilogslurmctld_line
         else:
             results["BCM prolog/epilog configured"] = False
             results["BCM epilogslurmctld configured"] = False
         
-        # Check if jobstats scripts are properly installed
-        # Shared scripts should exist on the slurm controller
-        shared_prolog = "/cm/shared/apps/slurm/var/cm/prolog-jobstats.sh"
-        shared_epilog = "/cm/shared/apps/slurm/var/cm/epilog-jobstats.sh"
-        
-        results["Shared prolog script exists"] = self._check_file_exists(shared_prolog, host)
-        results["Shared epilog script exists"] = self._check_file_exists(shared_epilog, host)
-        
-        # Check if scripts are executable
-        if results["Shared prolog script exists"]:
-            success, stdout, stderr = self._run_command(f"test -x {shared_prolog}", host)
-            results["Prolog script executable"] = success
-        else:
-            results["Prolog script executable"] = False
-            
-        if results["Shared epilog script exists"]:
-            success, stdout, stderr = self._run_command(f"test -x {shared_epilog}", host)
-            results["Epilog script executable"] = success
-        else:
-            results["Epilog script executable"] = False
+        # Check if jobstats scripts are properly installed and executable
+        # Shared scripts should exist on the slurm controller; all four checks run as one command
+        prolog_exists, epilog_exists, prolog_executable, epilog_executable = self._test_paths(
+            [('-f', SHARED_PROLOG_SCRIPT), ('-f', SHARED_EPILOG_SCRIPT),
+             ('-x', SHARED_PROLOG_SCRIPT), ('-x', SHARED_EPILOG_SCRIPT)],
+            host
+        )
+        results["Shared prolog script exists"] = prolog_exists
+        results["Shared epilog script exists"] = epilog_exists
+        results["Prolog script executable"] = prolog_exists and prolog_executable
+        results["Epilog script executable"] = epilog_exists and epilog_executable
         
         # Check symlinks on BCM headnode and login nodes (nodes that submit jobs)
-        prolog_script = "/cm/local/apps/slurm/var/prologs/60-prolog-jobstats.sh"
-        epilog_script = "/cm/local/apps/slurm/var/epilogs/60-epilog-jobstats.sh"
+        # BCM headnode (localhost) first
+        headnode_prolog, headnode_epilog = self._check_files_exist([PROLOG_SCRIPT, EPILOG_SCRIPT], None)  # localhost
         
-        # Check symlinks on BCM headnode (localhost)
-        headnode_prolog = self._check_file_exists(prolog_script, None)  # localhost
-        headnode_epilog = self._check_file_exists(epilog_script, None)  # localhost
-        
-        # Check symlinks on login nodes
+        # Check symlinks on login nodes concurrently, both scripts in one command per node
         login_nodes = self.config['systems'].get('login_nodes', [])
-        login_prolog = all(self._check_file_exists(prolog_script, login_host) for login_host in login_nodes) if login_nodes else True
-        login_epilog = all(self._check_file_exists(epilog_script, login_host) for login_host in login_nodes) if login_nodes else True
+        login_results = self._run_parallel(
+            self._check_files_exist,
+            [([PROLOG_SCRIPT, EPILOG_SCRIPT], login_host) for login_host in login_nodes]
+        )
+        login_prolog = all(prolog for prolog, epilog in login_results)
+        login_epilog = all(epilog for prolog, epilog in login_results)
         
         results["Prolog script symlink exists"] = headnode_prolog and login_prolog
         results["Epilog script symlink exists"] = headnode_epilog and login_epilog
@@ -219,17 +411,16 @@ class JobstatsValidator:
         
         if warning:
             self.results['warnings'] += 1
-            status = f"{Colors.YELLOW}⚠️  WARNING{Colors.END}"
+            status = self.WARN
         elif passed:
             self.results['passed'] += 1
-            status = f"{Colors.GREEN}✅ PASS{Colors.END}"
+            status = self.PASS
         else:
             self.results['failed'] += 1
-            status = f"{Colors.RED}❌ FAIL{Colors.END}"
+            status = self.FAIL
         
-        print(f"{status} {test_name}")
-        if message:
-            print(f"    {message}")
+        # One write per result rather than one per line
+        print(f"{status} {test_name}\n    {message}" if message else f"{status} {test_name}")
     
     def validate_services(self):
         """Validate that all required services are running."""
@@ -243,87 +434,108 @@ class JobstatsValidator:
             'grafana_server': ['grafana-server']
         }
         
-        for host_type, services in service_checks.items():
-            hosts = self.config['systems'].get(host_type, [])
-            for host in hosts:
-                for service in services:
-                    is_running = self._check_service(service, host)
-                    self._test_result(
-                        f"{service} on {host}",
-                        is_running,
-                        f"Service {'running' if is_running else 'not running'}"
-                    )
+        systems = self.config['systems']
+        checks = [
+            (services, host)
+            for host_type, services in service_checks.items()
+            for host in systems.get(host_type, [])
+        ]
+        
+        # Probe every host concurrently with one command per host, then report in the usual order
+        for (services, host), statuses in zip(checks, self._run_parallel(self._check_services, checks)):
+            for service, is_running in zip(services, statuses):
+                self._service_status[(service, host)] = is_running
+                self._test_result(
+                    f"{service} on {host}",
+                    is_running,
+                    f"Service {'running' if is_running else 'not running'}"
+                )
     
     def validate_ports(self):
         """Validate that all required ports are listening."""
         print(f"\n{Colors.BOLD}2. Checking Service Ports{Colors.END}")
         print("=" * 50)
         
+        config = self.config
         port_checks = {
             'dgx_nodes': [
-                (self.config['node_exporter_port'], 'node_exporter'),
-                (self.config['cgroup_exporter_port'], 'cgroup_exporter'),
-                (self.config['nvidia_gpu_exporter_port'], 'nvidia_gpu_exporter')
+                (config['node_exporter_port'], 'node_exporter'),
+                (config['cgroup_exporter_port'], 'cgroup_exporter'),
+                (config['nvidia_gpu_exporter_port'], 'nvidia_gpu_exporter')
             ],
-            'prometheus_server': [(self.config['prometheus_port'], 'prometheus')],
-            'grafana_server': [(self.config['grafana_port'], 'grafana')]
+            'prometheus_server': [(config['prometheus_port'], 'prometheus')],
+            'grafana_server': [(config['grafana_port'], 'grafana')]
         }
         
-        for host_type, ports in port_checks.items():
-            hosts = self.config['systems'].get(host_type, [])
-            for host in hosts:
-                for port, service in ports:
-                    is_listening = self._check_port(port, host)
-                    self._test_result(
-                        f"Port {port} ({service}) on {host}",
-                        is_listening,
-                        f"Port {'listening' if is_listening else 'not listening'}"
-                    )
+        systems = config['systems']
+        checks = [
+            (port, host, service)
+            for host_type, ports in port_checks.items()
+            for host in systems.get(host_type, [])
+            for port, service in ports
+        ]
+        
+        # Fetch each host's listening ports once, concurrently, then check every port locally
+        hosts = list(dict.fromkeys(host for port, host, service in checks))
+        self._run_parallel(self._get_listening_ports, [(host,) for host in hosts])
+        
+        for port, host, service in checks:
+            is_listening = self._check_port(port, host)
+            self._test_result(
+                f"Port {port} ({service}) on {host}",
+                is_listening,
+                f"Port {'listening' if is_listening else 'not listening'}"
+            )
     
     def validate_metrics_endpoints(self):
         """Validate that all metrics endpoints are responding."""
         print(f"\n{Colors.BOLD}3. Checking Metrics Endpoints{Colors.END}")
         print("=" * 50)
         
+        # URLs are formatted once here, not per host
+        config = self.config
         endpoint_checks = {
             'dgx_nodes': [
-                (f"http://localhost:{self.config['node_exporter_port']}/metrics", 'node_exporter'),
-                (f"http://localhost:{self.config['cgroup_exporter_port']}/metrics", 'cgroup_exporter'),
-                (f"http://localhost:{self.config['nvidia_gpu_exporter_port']}/metrics", 'nvidia_gpu_exporter')
+                (f"http://localhost:{config[f'{service}_port']}/metrics", service)
+                for service in ('node_exporter', 'cgroup_exporter', 'nvidia_gpu_exporter')
             ]
         }
         
-        for host_type, endpoints in endpoint_checks.items():
-            hosts = self.config['systems'].get(host_type, [])
-            for host in hosts:
-                for url, service in endpoints:
-                    is_responding, response = self._check_metrics_endpoint(url, host)
-                    self._test_result(
-                        f"{service} metrics on {host}",
-                        is_responding,
-                        f"Endpoint {'responding' if is_responding else 'not responding'}"
-                    )
+        systems = config['systems']
+        checks = [
+            (url, host, service)
+            for host_type, endpoints in endpoint_checks.items()
+            for host in systems.get(host_type, [])
+            for url, service in endpoints
+        ]
+        
+        results = self._run_parallel(lambda url, host, service: self._check_metrics_endpoint(url, host), checks)
+        for (url, host, service), (is_responding, response) in zip(checks, results):
+            self._test_result(
+                f"{service} metrics on {host}",
+                is_responding,
+                f"Endpoint {'responding' if is_responding else 'not responding'}"
+            )
     
     def validate_prometheus_targets(self):
         """Validate Prometheus targets and configuration."""
         print(f"\n{Colors.BOLD}4. Checking Prometheus Targets{Colors.END}")
         print("=" * 50)
         
-        prometheus_host = self.config['systems']['prometheus_server'][0]
-        prometheus_port = self.config['prometheus_port']
+        # Don't wait on the API of a server already known to be down
+        if not self._prometheus_running():
+            self._test_result("Prometheus API accessible", False, "Skipped - prometheus service is not running")
+            return
         
         # Check if Prometheus is responding
-        success, stdout, stderr = self._run_command(
-            f"curl -s http://localhost:{prometheus_port}/api/v1/targets", 
-            prometheus_host
-        )
+        success, stdout = self._prometheus_get("/api/v1/targets")
         
         if not success:
             self._test_result("Prometheus API accessible", False, "Cannot reach Prometheus API")
             return
         
         try:
-            targets_data = json.loads(stdout)
+            targets_data = _json_loads(stdout)
             active_targets = targets_data.get('data', {}).get('activeTargets', [])
             
             if not active_targets:
@@ -340,11 +552,13 @@ class JobstatsValidator:
             )
             
             # List all targets
+            lines = []
             for target in active_targets:
                 job = target.get('labels', {}).get('job', 'unknown')
                 health = target.get('health', 'unknown')
                 status = "✅" if health == "up" else "❌"
-                print(f"    {status} {job}: {health}")
+                lines.append(f"    {status} {job}: {health}")
+            print("\n".join(lines))
                 
         except json.JSONDecodeError:
             self._test_result("Prometheus targets parsing", False, "Invalid JSON response")
@@ -354,12 +568,13 @@ class JobstatsValidator:
         print(f"\n{Colors.BOLD}5. Checking Slurm Integration{Colors.END}")
         print("=" * 50)
         
-        # Check GPU tracking scripts on DGX nodes
+        # Check GPU tracking scripts on DGX nodes concurrently, then report in node order
         dgx_nodes = self.config['systems'].get('dgx_nodes', [])
-        for host in dgx_nodes:
-            prolog_exists = self._check_file_exists("/cm/local/apps/slurm/var/prologs/60-prolog-jobstats.sh", host)
-            epilog_exists = self._check_file_exists("/cm/local/apps/slurm/var/epilogs/60-epilog-jobstats.sh", host)
-            
+        dgx_results = self._run_parallel(
+            self._check_files_exist,
+            [([PROLOG_SCRIPT, EPILOG_SCRIPT], host) for host in dgx_nodes]
+        )
+        for host, (prolog_exists, epilog_exists) in zip(dgx_nodes, dgx_results):
             self._test_result(
                 f"GPU prolog script on {host}",
                 prolog_exists,
@@ -374,7 +589,7 @@ class JobstatsValidator:
         
         # Check job summary script on Slurm controller
         slurm_controller = self.config['systems']['slurm_controller'][0]
-        summary_script_exists = self._check_file_exists("/usr/local/sbin/slurmctldepilog.sh", slurm_controller)
+        summary_script_exists = self._check_file_exists(SLURMCTLD_EPILOG, slurm_controller)
         
         self._test_result(
             f"Job summary script on {slurm_controller}",
@@ -413,9 +628,10 @@ class JobstatsValidator:
             
             if success:
                 # Check if jobstats is executable
-                success, stdout, stderr = self._run_command("jobstats --help | head -1", host)
+                success, stdout, stderr = self._run_command(['jobstats', '--help'], host)
                 if success:
-                    print(f"    Version: {stdout.strip()}")
+                    version = stdout.strip().split('\n', 1)[0]
+                    print(f"    Version: {version}")
     
     def validate_bcm_requirements(self):
         """Validate BCM configuration requirements that should be automated."""
@@ -435,12 +651,14 @@ class JobstatsValidator:
         }
         
         print(f"Checking slurm.conf cgroup settings in {slurm_conf_path}...")
+        # Fetch slurm.conf once and look up every setting locally
+        success, stdout, stderr = self._run_command(['cat', slurm_conf_path], slurm_controller)
+        current_settings = {}
+        for setting, value in SLURM_CONF_SETTING_RE.findall(stdout):
+            current_settings.setdefault(setting, value)
+        
         for setting, expected_value in cgroup_settings.items():
-            success, stdout, stderr = self._run_command(
-                f"grep '^{setting}\\s*=' {slurm_conf_path} | head -1", 
-                slurm_controller
-            )
-            if success and expected_value in stdout:
+            if success and expected_value in current_settings.get(setting, ''):
                 self._test_result(
                     f"slurm.conf: {setting}",
                     True,
@@ -477,11 +695,8 @@ class JobstatsValidator:
         # Check if there are any recent jobs with the alloc/cores issue
         slurm_controller = self.config['systems']['slurm_controller'][0]
         
-        # Look for jobs in the last 24 hours
-        success, stdout, stderr = self._run_command(
-            "sacct -S $(date -d '1 day ago' '+%Y-%m-%d') --format=JobID,AllocCPUS,ReqCPUS,State --noheader | head -10",
-            slurm_controller
-        )
+        # Look at all jobs in the last 24 hours
+        success, rows = self._sacct_recent_jobs(['JobID', 'AllocCPUS', 'ReqCPUS', 'State'], slurm_controller)
         
         if not success:
             self._test_result(
@@ -495,20 +710,18 @@ class JobstatsValidator:
         alloc_cores_issues = 0
         total_jobs = 0
         
-        for line in stdout.strip().split('\n'):
-            if not line.strip():
-                continue
-                
-            parts = line.split()
-            if len(parts) >= 4:
-                job_id, alloc_cpus, req_cpus, state = parts[0], parts[1], parts[2], parts[3]
+        finished_states = {'COMPLETED', 'FAILED', 'CANCELLED'}
+        for row in rows:
+            if len(row) >= 4:
+                job_id, alloc_cpus, req_cpus, state = row[:4]
                 total_jobs += 1
                 
                 # Check for potential division issues (alloc_cpus != req_cpus when both are numbers)
                 try:
                     alloc_num = int(alloc_cpus)
                     req_num = int(req_cpus)
-                    if alloc_num != req_num and state in ['COMPLETED', 'FAILED', 'CANCELLED']:
+                    # State may carry a suffix, e.g. "CANCELLED by 1000"
+                    if alloc_num != req_num and state.split(' ', 1)[0] in finished_states:
                         alloc_cores_issues += 1
                 except ValueError:
                     continue
@@ -534,10 +747,7 @@ class JobstatsValidator:
         slurm_controller = self.config['systems']['slurm_controller'][0]
         
         # Check for jobs with unusual timelimit patterns
-        success, stdout, stderr = self._run_command(
-            "sacct -S $(date -d '1 day ago' '+%Y-%m-%d') --format=JobID,TimeLimit,Elapsed,State --noheader | head -10",
-            slurm_controller
-        )
+        success, rows = self._sacct_recent_jobs(['JobID', 'TimeLimit', 'Elapsed', 'State'], slurm_controller)
         
         if not success:
             self._test_result(
@@ -551,13 +761,9 @@ class JobstatsValidator:
         timelimit_issues = 0
         total_jobs = 0
         
-        for line in stdout.strip().split('\n'):
-            if not line.strip():
-                continue
-                
-            parts = line.split()
-            if len(parts) >= 4:
-                job_id, time_limit, elapsed, state = parts[0], parts[1], parts[2], parts[3]
+        for row in rows:
+            if len(row) >= 4:
+                job_id, time_limit, elapsed, state = row[:4]
                 total_jobs += 1
                 
                 # Check for jobs that failed due to time limit
@@ -595,12 +801,13 @@ class JobstatsValidator:
         login_host = login_nodes[0]
         
         # Get a recent completed job
-        success, stdout, stderr = self._run_command(
-            "sacct -S $(date -d '1 day ago' '+%Y-%m-%d') --format=JobID,State --noheader | grep -E '(COMPLETED|FAILED|CANCELLED)' | head -1",
-            login_host
-        )
+        success, rows = self._sacct_recent_jobs(['JobID', 'State'], login_host)
+        finished = [
+            row for row in rows
+            if len(row) >= 2 and row[1].split(' ', 1)[0] in ('COMPLETED', 'FAILED', 'CANCELLED')
+        ]
         
-        if not success or not stdout.strip():
+        if not success or not finished:
             self._test_result(
                 "Job data completeness",
                 True,
@@ -608,11 +815,11 @@ class JobstatsValidator:
             )
             return
         
-        job_id = stdout.strip().split()[0]
+        job_id = finished[0][0]
         
         # Test jobstats command on this job
         success, stdout, stderr = self._run_command(
-            f"jobstats {job_id}",
+            ['jobstats', job_id],
             login_host
         )
         
@@ -641,92 +848,58 @@ class JobstatsValidator:
         """Test that Prometheus metrics have consistent labels."""
         print(f"\n{Colors.BLUE}Testing metric label consistency...{Colors.END}")
         
-        prometheus_host = self.config['systems']['prometheus_server'][0]
-        prometheus_port = self.config['prometheus_port']
-        
-        # Check node_exporter labels
-        success, stdout, stderr = self._run_command(
-            f"curl -s 'http://localhost:{self.config['prometheus_port']}/api/v1/query?query=node_uname_info' | jq '.data.result[0].metric' 2>/dev/null || echo 'no_data'",
-            prometheus_host
-        )
+        if not self._prometheus_running():
+            self._test_result("Metric label consistency", False, "Skipped - prometheus service is not running")
+            return
         
-        if success and stdout.strip() and stdout.strip() != 'no_data':
-            # Parse the JSON metric object
+        # Fetch the label sets of every probed metric in one request, limited to recent series
+        query = urllib.parse.urlencode([
+            ('match[]', 'node_uname_info'),
+            ('match[]', 'cgroup_cpu_total_seconds'),
+            ('start', int(time.time()) - 300)
+        ])
+        success, stdout = self._prometheus_get(f"/api/v1/series?{query}")
+        
+        series = {}
+        parse_failed = False
+        if success and stdout.strip():
             try:
-                import json
-                metric = json.loads(stdout)
-                if metric is None:
-                    self._test_result(
-                        "Node exporter labels",
-                        False,
-                        "No node_exporter metrics found - check if node_exporter is running and accessible"
-                    )
-                else:
-                    required_labels = ['instance', 'job', 'nodename']
-                    missing_labels = []
-                    
-                    for label in required_labels:
-                        if label not in metric:
-                            missing_labels.append(label)
-                    
-                    self._test_result(
-                        "Node exporter labels",
-                        len(missing_labels) == 0,
-                        f"Missing labels: {', '.join(missing_labels)}" if missing_labels else "All required labels present"
-                    )
+                series = self._first_series_by_name(stdout)
             except json.JSONDecodeError:
-                self._test_result(
-                    "Node exporter labels",
-                    False,
-                    "Failed to parse metric labels JSON"
-                )
-        else:
+                parse_failed = True
+        
+        # Check node_exporter labels
+        metric = series.get('node_uname_info')
+        if parse_failed:
+            self._test_result(
+                "Node exporter labels",
+                False,
+                "Failed to parse metric labels JSON"
+            )
+        elif metric is None:
             self._test_result(
                 "Node exporter labels",
                 False,
                 "No node_exporter metrics found - check if node_exporter is running and accessible"
             )
+        else:
+            missing_labels = [label for label in NODE_EXPORTER_LABELS if label not in metric]
+            
+            self._test_result(
+                "Node exporter labels",
+                len(missing_labels) == 0,
+                f"Missing labels: {', '.join(missing_labels)}" if missing_labels else "All required labels present"
+            )
         
         # Check cgroup metrics labels
-        success, stdout, stderr = self._run_command(
-            f"curl -s 'http://localhost:{prometheus_port}/api/v1/query?query=cgroup_cpu_total_seconds' | jq '.data.result[0].metric' 2>/dev/null || echo 'no_data'",
-            prometheus_host
-        )
-        
-        if success and stdout.strip() and stdout.strip() != 'no_data':
-            # Parse the JSON metric object
-            try:
-                import json
-                metric = json.loads(stdout)
-                if metric is None:
-                    self._test_result(
-                        "Cgroup metric labels",
-                        False,
-                        "No cgroup metrics found - check cgroup_exporter configuration",
-                        warning=True
-                    )
-                    self._check_cgroup_exporter_config()
-                else:
-                    # Check for required labels (based on actual cgroup_exporter output)
-                    required_labels = ['jobid', 'cluster', 'instance', 'job']
-                    missing_labels = []
-                    
-                    for label in required_labels:
-                        if label not in metric:
-                            missing_labels.append(label)
-                    
-                    self._test_result(
-                        "Cgroup metric labels",
-                        len(missing_labels) == 0,
-                        f"Missing labels: {', '.join(missing_labels)}" if missing_labels else "All required labels present"
-                    )
-            except json.JSONDecodeError:
-                self._test_result(
-                    "Cgroup metric labels",
-                    False,
-                    "Failed to parse metric labels JSON"
-                )
-        else:
+        metric = series.get('cgroup_cpu_total_seconds')
+        if parse_failed:
+            self._test_result(
+                "Cgroup metric labels",
+                False,
+                "Failed to parse metric labels JSON"
+            )
+        elif metric is None:
             self._test_result(
                 "Cgroup metric labels",
                 False,
@@ -734,6 +907,22 @@ class JobstatsValidator:
                 warning=True
             )
             self._check_cgroup_exporter_config()
+        else:
+            missing_labels = [label for label in CGROUP_EXPORTER_LABELS if label not in metric]
+            
+            self._test_result(
+                "Cgroup metric labels",
+                len(missing_labels) == 0,
+                f"Missing labels: {', '.join(missing_labels)}" if missing_labels else "All required labels present"
+            )
+    
+    @staticmethod
+    def _first_series_by_name(response: str) -> Dict[str, Dict]:
+        """Map each metric name in a Prometheus series response to the label set of its first series."""
+        series = {}
+        for labels in _json_loads(response).get('data') or []:
+            series.setdefault(labels.get('__name__'), labels)
+        return series
     
     def _check_cgroup_exporter_config(self):
         """Check cgroup_exporter configuration and provide diagnostic information."""
@@ -745,34 +934,41 @@ class JobstatsValidator:
             dgx_host = dgx_nodes[0]
             
             # Get cgroup_exporter configuration
-            success, stdout, stderr = self._run_command(
-                "systemctl cat cgroup_exporter | grep ExecStart",
-                dgx_host
-            )
+            success, stdout, stderr = self._run_command(['systemctl', 'cat', 'cgroup_exporter'], dgx_host)
+            exec_start = [line for line in stdout.splitlines() if 'ExecStart' in line]
+            stdout = '\n'.join(exec_start)
             
-            if success:
+            if success and exec_start:
                 print(f"{Colors.BLUE}Current cgroup_exporter config: {stdout.strip()}{Colors.END}")
                 
-                # Check what cgroup paths exist
+                # Walk the cgroup tree once, tagging Slurm cgroup directories and job-specific
+                # entries separately (find's ',' evaluates both expressions for every entry)
                 success, stdout, stderr = self._run_command(
-                    "find /sys/fs/cgroup/ -name '*slurm*' -type d 2>/dev/null | head -5",
+                    ['find', '/sys/fs/cgroup/',
+                     '(', '-name', '*slurm*', '-type', 'd', '-printf', 'SLURM %p\\n', ')', ',',
+                     '(', '(', '-path', '*/slurm/*', '-name', '*job*', '-o', '-name', '*uid*', ')',
+                     '-printf', 'JOB %p\\n', ')'],
                     dgx_host
                 )
+                slurm_paths = []
+                job_paths = []
+                for line in stdout.splitlines():
+                    kind, _, path = line.partition(' ')
+                    if kind == 'SLURM':
+                        slurm_paths.append(path)
+                    elif kind == 'JOB':
+                        job_paths.append(path)
                 
-                if success and stdout.strip():
+                # Check what cgroup paths exist
+                if slurm_paths:
                     print(f"{Colors.BLUE}Available cgroup paths:{Colors.END}")
-                    for path in stdout.strip().split('\n'):
+                    for path in slurm_paths[:5]:
                         print(f"  {path}")
                 
                 # Check if there are job-specific cgroup directories
-                success, stdout, stderr = self._run_command(
-                    "find /sys/fs/cgroup/ -path '*/slurm/*' -name '*job*' -o -name '*uid*' 2>/dev/null | head -5",
-                    dgx_host
-                )
-                
-                if success and stdout.strip():
+                if job_paths:
                     print(f"{Colors.GREEN}Found job-specific cgroup directories:{Colors.END}")
-                    for path in stdout.strip().split('\n'):
+                    for path in job_paths[:5]:
                         print(f"  {path}")
                 else:
                     print(f"{Colors.YELLOW}No job-specific cgroup directories found{Colors.END}")
@@ -839,7 +1035,7 @@ class JobstatsValidator:
             
             # Check if service is enabled
             success, stdout, stderr = self._run_command(
-                "systemctl is-enabled bcm-role-monitor",
+                ['systemctl', 'is-enabled', 'bcm-role-monitor'],
                 dgx_host
             )
             is_enabled = success and stdout.strip() == "enabled"
@@ -863,10 +1059,10 @@ class JobstatsValidator:
             
             if target_exists:
                 # Read and validate the target file content
-                success, stdout, stderr = self._run_command(f"cat {target_file}", dgx_host)
+                success, stdout, stderr = self._run_command(['cat', target_file], dgx_host)
                 if success:
                     try:
-                        target_data = json.loads(stdout)
+                        target_data = _json_loads(stdout)
                         
                         # Validate structure: should be a list of target objects
                         if isinstance(target_data, list) and len(target_data) > 0:
@@ -928,7 +1124,7 @@ class JobstatsValidator:
             
             # Check service logs for recent activity
             success, stdout, stderr = self._run_command(
-                "journalctl -u bcm-role-monitor --since '5 minutes ago' --no-pager | tail -5",
+                ['journalctl', '-u', 'bcm-role-monitor', '--since', '5 minutes ago', '--no-pager', '-n', '5'],
                 dgx_host
             )
             
@@ -977,6 +1173,8 @@ class JobstatsValidator:
         print("=" * 60)
         
         try:
+            # Later checks then reuse an established connection instead of racing to open one
+            self._open_ssh_masters()
             self.validate_services()
             self.validate_ports()
             self.validate_metrics_endpoints()
@@ -996,6 +1194,8 @@ class JobstatsValidator:
         except Exception as e:
             print(f"\n{Colors.RED}Validation failed with error: {e}{Colors.END}")
             return False
+        finally:
+            self._close_ssh_masters()
 
 
 def main():
@@ -1011,10 +1211,29 @@ def main():
         action="store_true",
         help="Enable verbose output"
     )
+    parser.add_argument(
+        "--direct-http",
+        action="store_true",
+        help="Query exporter and Prometheus endpoints directly over HTTP instead of through SSH"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=30,
+        help="Per-command timeout in seconds (default: 30)"
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=32,
+        help="Maximum number of hosts to probe concurrently (default: 32)"
+    )
     
     args = parser.parse_args()
     
-    validator = JobstatsValidator(args.config, args.verbose)
+    validator = JobstatsValidator(args.config, args.verbose, args.max_workers, args.timeout)
+    if args.direct_http:
+        validator.config['direct_http'] = True
     success = validator.run_validation()
     
     sys.exit(0 if success else 1)
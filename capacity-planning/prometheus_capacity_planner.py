@@ -49,15 +49,46 @@ Date: 2025-10-06
 """
 
 import argparse
+import calendar
 import json
 import subprocess
 import sys
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 from collections import defaultdict
 from dataclasses import dataclass, asdict
 
+# GPU count from scontrol CfgTRES, e.g. CfgTRES=cpu=224,mem=2T,billing=224,gres/gpu=8
+CFG_TRES_GPU_RE = re.compile(r'CfgTRES=\S*?gres/gpu=(\d+)')
+# GPU count from a Gres field, e.g. gpu:8, gpu:A100:8(S:0), gpu=8
+GRES_GPU_RE = re.compile(r'gpu[=:](?:[^:=]+:)?(\d+)')
+# Gres field in scontrol output, e.g. Gres=gpu:A100:8(S:0)
+NODE_GRES_GPU_RE = re.compile(r'Gres=gpu[=:](?:[^:=]+:)?(\d+)')
+# GPU allocation from sacct AllocTRES, e.g. gres/gpu=1 or gres/gpu:a100=2
+ALLOC_TRES_GPU_RE = re.compile(r'gres/gpu[^=]*=(\d+)')
+# Node name leading each record of "scontrol -o show nodes", e.g. NodeName=dgx-01 Arch=x86_64 ...
+SCONTROL_NODE_NAME_RE = re.compile(r'NodeName=(\S+)')
+
+
+def _parse_slurm_timestamp(value: str) -> int:
+    """
+    Convert a Slurm YYYY-MM-DDTHH:MM:SS timestamp to epoch seconds.
+    
+    Slices the fixed-width fields instead of going through strptime, which dominates
+    the per-job parse cost over large sacct histories. The time is read as UTC, so
+    differences match naive datetime subtraction.
+    """
+    if (len(value) != 19 or value[4] != '-' or value[7] != '-' or value[10] != 'T'
+            or value[13] != ':' or value[16] != ':'):
+        raise ValueError(f"Not a Slurm timestamp: {value}")
+    return calendar.timegm((
+        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+        int(value[11:13]), int(value[14:16]), int(value[17:19]), 0, 0, 0
+    ))
+
 
 class Colors:
     """ANSI color codes for terminal output."""
@@ -141,15 +172,21 @@ class PrometheusCapacityPlanner:
                  retention_days: int = 365,
                  scrape_interval: int = 30,
                  analysis_days: int = 30,
-                 verbose: bool = False):
+                 verbose: bool = False,
+                 scontrol_parallelism: int = 16,
+                 sacct_timeout: int = 30):
         """Initialize the capacity planner."""
         self.retention_days = retention_days
         self.scrape_interval = scrape_interval
         self.analysis_days = analysis_days
         self.verbose = verbose
+        self.scontrol_parallelism = scontrol_parallelism
+        self.sacct_timeout = sacct_timeout
         
         self.nodes: List[NodeConfig] = []
         self.job_stats: Dict = {}
+        # scontrol node records by hostname (None if the node could not be queried)
+        self._scontrol_nodes: Dict[str, Optional[str]] = {}
         
     def log(self, message: str, level: str = "INFO"):
         """Log a message with color coding."""
@@ -167,12 +204,15 @@ class PrometheusCapacityPlanner:
         color = color_map.get(level, "")
         print(f"{color}{message}{Colors.END}")
     
-    def run_command(self, command: str) -> Tuple[bool, str]:
-        """Run a shell command and return success status and output."""
+    def run_command(self, command: Union[str, List[str]]) -> Tuple[bool, str]:
+        """Run a command and return success status and output.
+        
+        A string is run by the shell; an argv list is executed directly.
+        """
         try:
             result = subprocess.run(
                 command,
-                shell=True,
+                shell=isinstance(command, str),
                 capture_output=True,
                 text=True,
                 timeout=30
@@ -183,6 +223,35 @@ class PrometheusCapacityPlanner:
         except Exception as e:
             return False, str(e)
     
+    def _load_scontrol_nodes(self, hostnames: List[str]):
+        """Fetch the scontrol records of the given nodes, with a single call where possible."""
+        success, output = self.run_command(['scontrol', '-o', 'show', 'nodes'])
+        if success:
+            for line in output.split('\n'):
+                match = SCONTROL_NODE_NAME_RE.match(line)
+                if match:
+                    self._scontrol_nodes[match.group(1)] = line
+        else:
+            self.log("Could not bulk-load scontrol node records, querying nodes individually", "DEBUG")
+        
+        # Query any nodes the bulk call missed concurrently; each call mostly waits on slurmctld
+        missing = [node for node in hostnames if node not in self._scontrol_nodes]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, self.scontrol_parallelism)) as executor:
+                for node, (success, output) in zip(missing, executor.map(self._query_scontrol_node, missing)):
+                    self._scontrol_nodes[node] = output if success else None
+    
+    def _query_scontrol_node(self, node: str) -> Tuple[bool, str]:
+        """Run scontrol for a single node."""
+        return self.run_command(['scontrol', 'show', 'node', node])
+    
+    def _scontrol_node_record(self, node: str) -> Optional[str]:
+        """Return a node's scontrol record, querying it only if it was not loaded up front."""
+        if node not in self._scontrol_nodes:
+            success, output = self._query_scontrol_node(node)
+            self._scontrol_nodes[node] = output if success else None
+        return self._scontrol_nodes[node]
+    
     def detect_gpu_type(self, node: str) -> Tuple[int, str]:
         """
         Detect GPU count and type (standard, MIG 90GB, MIG 45GB).
@@ -191,18 +260,18 @@ class PrometheusCapacityPlanner:
             Tuple of (gpu_count, gpu_type)
         """
         # Try to get GPU info from scontrol
-        success, output = self.run_command(f"scontrol show node {node}")
-        if not success:
+        output = self._scontrol_node_record(node)
+        if output is None:
             return 0, 'none'
         
         # Try CfgTRES first (most reliable)
-        tres_match = re.search(r'CfgTRES=.*?gres/gpu=(\d+)', output)
+        tres_match = CFG_TRES_GPU_RE.search(output)
         if tres_match:
             gpu_count = int(tres_match.group(1))
         else:
             # Fallback to Gres field - try multiple formats
             # Formats: Gres=gpu:1, Gres=gpu:A100:1(S:0), etc.
-            gres_match = re.search(r'Gres=gpu[=:](?:[^:=]+:)?(\d+)', output)
+            gres_match = NODE_GRES_GPU_RE.search(output)
             if not gres_match:
                 return 0, 'none'
             gpu_count = int(gres_match.group(1))
@@ -236,6 +305,12 @@ class PrometheusCapacityPlanner:
             self.log("Make sure Slurm is installed and you have access to sinfo", "ERROR")
             sys.exit(1)
         
+        # One scontrol call for all nodes instead of one (or two) per node
+        hostnames = list(dict.fromkeys(
+            line.split('|', 1)[0].strip() for line in output.split('\n') if line.strip()
+        ))
+        self._load_scontrol_nodes(hostnames)
+        
         node_dict = {}  # Use dict to deduplicate nodes across partitions
         
         for line in output.split('\n'):
@@ -258,16 +333,16 @@ class PrometheusCapacityPlanner:
             gpu_count = 0
             if 'gpu:' in gres or 'gpu=' in gres:
                 # Match patterns like: gpu:1, gpu:A100:1, gpu=1, etc.
-                match = re.search(r'gpu[=:](?:[^:=]+:)?(\d+)', gres)
+                match = GRES_GPU_RE.search(gres)
                 if match:
                     gpu_count = int(match.group(1))
             
             # If still no GPU found, try CfgTRES from scontrol
             if gpu_count == 0:
-                success, node_output = self.run_command(f"scontrol show node {hostname}")
-                if success:
+                node_output = self._scontrol_node_record(hostname)
+                if node_output is not None:
                     # Look for CfgTRES=...gres/gpu=N
-                    tres_match = re.search(r'CfgTRES=.*?gres/gpu=(\d+)', node_output)
+                    tres_match = CFG_TRES_GPU_RE.search(node_output)
                     if tres_match:
                         gpu_count = int(tres_match.group(1))
             
@@ -349,15 +424,92 @@ class PrometheusCapacityPlanner:
         # Get job data from sacct
         # Format: JobID|Partition|State|Start|End|AllocCPUS|AllocNodes|AllocTRES
         # Note: Using AllocTRES instead of deprecated AllocGRES (Slurm 23.11+)
-        cmd = (
-            f"sacct -a -P -n "
-            f"--starttime={start_date.strftime('%Y-%m-%d')} "
-            f"--endtime={end_date.strftime('%Y-%m-%d')} "
-            f"--format=JobID,Partition,State,Start,End,AllocCPUS,AllocNodes,AllocTRES "
-            f"--state=COMPLETED,FAILED,CANCELLED,TIMEOUT"
-        )
+        cmd = [
+            'sacct', '-a', '-P', '-n',
+            f"--starttime={start_date.strftime('%Y-%m-%d')}",
+            f"--endtime={end_date.strftime('%Y-%m-%d')}",
+            '--format=JobID,Partition,State,Start,End,AllocCPUS,AllocNodes,AllocTRES',
+            '--state=COMPLETED,FAILED,CANCELLED,TIMEOUT'
+        ]
+        
+        # Stream and parse sacct's output as it arrives, keeping only running totals,
+        # so memory stays flat however many jobs the analysis window holds
+        total_jobs = 0
+        gpu_job_count = 0
+        total_duration = 0.0
+        partition_stats = defaultdict(lambda: {'jobs': 0, 'gpu_jobs': 0, 'cpu_jobs': 0, 'total_duration': 0})
         
-        success, output = self.run_command(cmd)
+        try:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as proc:
+                # Kill sacct if it runs past the limit (e.g. a stalled slurmdbd); the read loop then
+                # sees EOF and the run counts as failed, so the estimates are used instead
+                timed_out = threading.Event()
+                def kill_sacct():
+                    if proc.poll() is None:
+                        timed_out.set()
+                        proc.kill()
+                timer = threading.Timer(self.sacct_timeout, kill_sacct)
+                timer.daemon = True
+                timer.start()
+                
+                try:
+                    for line in proc.stdout:
+                        line = line.strip()
+                        if not line or '.batch' in line or '.extern' in line:
+                            continue
+                    
+                        parts = line.split('|')
+                        if len(parts) < 8:
+                            continue
+                    
+                        try:
+                            partition = parts[1].strip()
+                            start_time = parts[3].strip()
+                            end_time = parts[4].strip()
+                            alloc_tres = parts[7].strip()
+                        
+                            # Parse GPU allocation from AllocTRES
+                            # Format: billing=8,cpu=8,mem=240G,node=1,gres/gpu=1
+                            # or: cpu=8,mem=240G,node=1,gres/gpu:a100=1
+                            alloc_gpus = 0
+                            if 'gres/gpu' in alloc_tres:
+                                # Match patterns like: gres/gpu=1, gres/gpu:a100=2, etc.
+                                match = ALLOC_TRES_GPU_RE.search(alloc_tres)
+                                if match:
+                                    alloc_gpus = int(match.group(1))
+                        
+                            # Calculate duration
+                            if start_time != 'Unknown' and end_time != 'Unknown':
+                                try:
+                                    duration_seconds = _parse_slurm_timestamp(end_time) - _parse_slurm_timestamp(start_time)
+                                    duration_hours = duration_seconds / 3600
+                                except:
+                                    duration_hours = 1.0  # Default
+                            else:
+                                duration_hours = 1.0
+                        except Exception as e:
+                            if self.verbose:
+                                self.log(f"Warning: Could not parse job line: {line[:50]}... ({e})", "DEBUG")
+                            continue
+                    
+                        total_jobs += 1
+                        total_duration += duration_hours
+                        stats = partition_stats[partition]
+                        stats['jobs'] += 1
+                        stats['total_duration'] += duration_hours
+                        if alloc_gpus > 0:
+                            gpu_job_count += 1
+                            stats['gpu_jobs'] += 1
+                        else:
+                            stats['cpu_jobs'] += 1
+                finally:
+                    timer.cancel()
+            
+            if timed_out.is_set():
+                self.log(f"Warning: sacct did not finish within {self.sacct_timeout} seconds", "WARNING")
+            success = proc.returncode == 0 and not timed_out.is_set()
+        except OSError:
+            success = False
         
         if not success:
             self.log("Warning: Could not retrieve job history from sacct", "WARNING")
@@ -365,75 +517,16 @@ class PrometheusCapacityPlanner:
             self._use_estimated_job_stats()
             return
         
-        # Parse job data
-        jobs = []
-        for line in output.split('\n'):
-            if not line.strip() or '.batch' in line or '.extern' in line:
-                continue
-            
-            parts = line.split('|')
-            if len(parts) < 8:
-                continue
-            
-            try:
-                job_id = parts[0].strip()
-                partition = parts[1].strip()
-                state = parts[2].strip()
-                start_time = parts[3].strip()
-                end_time = parts[4].strip()
-                alloc_cpus = int(parts[5].strip()) if parts[5].strip().isdigit() else 0
-                alloc_nodes = int(parts[6].strip()) if parts[6].strip().isdigit() else 0
-                alloc_tres = parts[7].strip()
-                
-                # Parse GPU allocation from AllocTRES
-                # Format: billing=8,cpu=8,mem=240G,node=1,gres/gpu=1
-                # or: cpu=8,mem=240G,node=1,gres/gpu:a100=1
-                alloc_gpus = 0
-                if 'gres/gpu' in alloc_tres:
-                    # Match patterns like: gres/gpu=1, gres/gpu:a100=2, etc.
-                    match = re.search(r'gres/gpu[^=]*=(\d+)', alloc_tres)
-                    if match:
-                        alloc_gpus = int(match.group(1))
-                
-                # Calculate duration
-                if start_time != 'Unknown' and end_time != 'Unknown':
-                    try:
-                        start_dt = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S')
-                        end_dt = datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S')
-                        duration_hours = (end_dt - start_dt).total_seconds() / 3600
-                    except:
-                        duration_hours = 1.0  # Default
-                else:
-                    duration_hours = 1.0
-                
-                jobs.append({
-                    'job_id': job_id,
-                    'partition': partition,
-                    'state': state,
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'duration_hours': duration_hours,
-                    'alloc_cpus': alloc_cpus,
-                    'alloc_nodes': alloc_nodes,
-                    'alloc_gpus': alloc_gpus,
-                    'is_gpu_job': alloc_gpus > 0
-                })
-            except Exception as e:
-                if self.verbose:
-                    self.log(f"Warning: Could not parse job line: {line[:50]}... ({e})", "DEBUG")
-                continue
-        
-        if not jobs:
+        if not total_jobs:
             self.log("No job history found, using estimates", "WARNING")
             self._use_estimated_job_stats()
             return
         
         # Calculate statistics
-        total_jobs = len(jobs)
-        gpu_jobs = [j for j in jobs if j['is_gpu_job']]
-        cpu_jobs = [j for j in jobs if not j['is_gpu_job']]
+        gpu_jobs = gpu_job_count
+        cpu_jobs = total_jobs - gpu_job_count
         
-        avg_duration = sum(j['duration_hours'] for j in jobs) / len(jobs) if jobs else 1.0
+        avg_duration = total_duration / total_jobs
         jobs_per_day = total_jobs / self.analysis_days
         
         # Calculate concurrent jobs (approximate)
@@ -441,21 +534,10 @@ class PrometheusCapacityPlanner:
         avg_concurrent = (jobs_per_day * avg_duration) / 24
         max_concurrent = int(avg_concurrent * 2)  # Rough estimate of peak
         
-        # Per-partition statistics
-        partition_stats = defaultdict(lambda: {'jobs': 0, 'gpu_jobs': 0, 'cpu_jobs': 0, 'total_duration': 0})
-        for job in jobs:
-            p = job['partition']
-            partition_stats[p]['jobs'] += 1
-            if job['is_gpu_job']:
-                partition_stats[p]['gpu_jobs'] += 1
-            else:
-                partition_stats[p]['cpu_jobs'] += 1
-            partition_stats[p]['total_duration'] += job['duration_hours']
-        
         self.job_stats = {
             'total_jobs': total_jobs,
-            'gpu_jobs': len(gpu_jobs),
-            'cpu_jobs': len(cpu_jobs),
+            'gpu_jobs': gpu_jobs,
+            'cpu_jobs': cpu_jobs,
             'avg_duration_hours': avg_duration,
             'jobs_per_day': jobs_per_day,
             'avg_concurrent_jobs': avg_concurrent,
@@ -465,8 +547,8 @@ class PrometheusCapacityPlanner:
         
         # Print summary
         self.log(f"\n✓ Analyzed {total_jobs} jobs over {self.analysis_days} days:", "SUCCESS")
-        self.log(f"  • GPU jobs: {len(gpu_jobs)} ({len(gpu_jobs)/total_jobs*100:.1f}%)", "INFO")
-        self.log(f"  • CPU jobs: {len(cpu_jobs)} ({len(cpu_jobs)/total_jobs*100:.1f}%)", "INFO")
+        self.log(f"  • GPU jobs: {gpu_jobs} ({gpu_jobs/total_jobs*100:.1f}%)", "INFO")
+        self.log(f"  • CPU jobs: {cpu_jobs} ({cpu_jobs/total_jobs*100:.1f}%)", "INFO")
         self.log(f"  • Average job duration: {avg_duration:.1f} hours", "INFO")
         self.log(f"  • Jobs per day: {jobs_per_day:.1f}", "INFO")
         self.log(f"  • Estimated avg concurrent jobs: {avg_concurrent:.1f}", "INFO")
@@ -911,6 +993,20 @@ Examples:
         help='Enable verbose output with detailed breakdowns'
     )
     
+    parser.add_argument(
+        '--sacct-timeout',
+        type=int,
+        default=30,
+        help='Seconds to wait for sacct job history before falling back to estimates (default: 30)'
+    )
+    
+    parser.add_argument(
+        '--scontrol-parallelism',
+        type=int,
+        default=16,
+        help='Concurrent per-node scontrol queries when the bulk node query is unavailable (default: 16)'
+    )
+    
     args = parser.parse_args()
     
     # Create planner and run
@@ -918,7 +1014,9 @@ Examples:
         retention_days=args.retention_days,
         scrape_interval=args.scrape_interval,
         analysis_days=args.analysis_days,
-        verbose=args.verbose
+        verbose=args.verbose,
+        scontrol_parallelism=args.scontrol_parallelism,
+        sacct_timeout=args.sacct_timeout
     )
     
     try: